@@ -1,13 +1,13 @@
-from flask import Flask, render_template, request, session, g, redirect, url_for, flash, Markup
+from flask import Flask, render_template, request, session, g, redirect, url_for, flash, Markup, abort
 from authlib.integrations.flask_client import OAuth
 from urllib.request import Request, urlopen, URLError
 import sqlite3 as sql
 import argparse, re
-from collections import defaultdict, namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
 import os
 from functools import wraps
-from collections import deque
 import json
+import threading
 
 """ GLOBAL VARIABLES """
 app = Flask(__name__)
@@ -16,7 +16,15 @@ NUM_TALKS = 50
 DATABASE_SCHEMA_FILE = 'schema.sql'
 DATABASE = 'annotations.db'
 TABLE_NAME = 'annotations'
+# seconds a connection waits for another writer before failing with "database is locked"
+DATABASE_TIMEOUT = 30
+# with WAL journaling, NORMAL only syncs at checkpoints and cannot corrupt the database
+DATABASE_SYNCHRONOUS = 'NORMAL'
 translation_type_dict = {0: 'target1', 1: 'target2', 2: 'mismatch', 3: 'mismatch'}
+# number of examples of a talk fetched at once, the current one and the next ones
+QUEUE_PREFETCH = 8
+# maximum number of examples kept in memory, shared by all annotators
+ROW_CACHE_SIZE = 2048
 # REGEXs FOR EXTRACTING TERMS FROM ANNOTATIONS
 term_regex = re.compile(r'<mark>(.*)</mark>')
 highlight_pattern = re.compile(r'<span.*"true">(.*)</span>')
@@ -24,10 +32,10 @@ h_regex = re.compile(r'<h>(.*)</h>')
 
 # FOR MESSAGE FLASHING
 app.secret_key = ''
-# FOR STORING STATE OF THE APPLICATION
-user_data = dict()
-user_talkid = dict()  # save current talk_id
-user_turnid = dict()
+# FOR REUSING ONE DATABASE CONNECTION PER THREAD, see get_db; it also holds the progress cache of the connection
+# Annotation progress is only stored in the database, and the example being annotated is sent with the form, so any
+# number of processes can serve the same users.
+local_db = threading.local()
 
 """ OAUTH CODE """
 # app.config['GOOGLE_CLIENT_ID'] = ''
@@ -66,7 +74,6 @@ def login():
 
 @app.route('/logout')
 def logout():
-    # TODO: can delete user_data for current user (g.user) here
     session.pop('annotator_id', None)
     return redirect(url_for('login'))
     
@@ -80,6 +87,14 @@ def auth():
 
 
 """ DATABASE CODE  """
+# schema migrations, applied in order by migrate_db; PRAGMA user_version is the number of applied migrations
+MIGRATIONS = [
+    # covering indexes for the lookups of menu, turn, task, get_num_annotated and the progress counts
+    ['DROP INDEX IF EXISTS annotations_progress;',
+     'CREATE INDEX annotations_progress ON annotations (username, talk_id, is_annotated, term_id);',
+     'CREATE INDEX annotations_talk ON annotations (talk_id, username, is_annotated);'],
+]
+
 # for representing rows from database
 Row = namedtuple('Row', 'username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence, is_annotated')
 
@@ -101,6 +116,32 @@ def init_db():
             if (TABLE_NAME,) not in tables:
                 db.cursor().executescript(f.read())
         db.commit()
+        migrate_db(db)
+
+
+def migrate_db(db):
+    """
+    Apply the schema migrations the database is missing, in one transaction.
+    Does nothing before the schema file was loaded.
+    :param db: A connection to the database.
+    :return: None
+    """
+    if db.execute('SELECT name FROM sqlite_master WHERE type = "table" AND name = ?;', (TABLE_NAME,)).fetchone() is None:
+        return
+    if db.execute('PRAGMA user_version;').fetchone()[0] >= len(MIGRATIONS):
+        return
+    # take the write lock first, so that concurrently starting processes migrate once
+    db.execute('BEGIN IMMEDIATE;')
+    try:
+        version = db.execute('PRAGMA user_version;').fetchone()[0]
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                db.execute(statement)
+        db.execute('PRAGMA user_version = {};'.format(max(version, len(MIGRATIONS))))
+        db.commit()
+    except:
+        db.rollback()
+        raise
 
 
 def insert_db(query, args=()):
@@ -112,50 +153,77 @@ def insert_db(query, args=()):
 
 def query_db(query, args=(), one=False, return_namedtuple=True):
     con = get_db()
+    cur = con.cursor()
+    # connections are shared between requests, so the factory is set per cursor
     if return_namedtuple:
-        con.row_factory = namedtuple_factory
-    cur = con.execute(query, args)
+        cur.row_factory = namedtuple_factory
+    cur.execute(query, args)
     rv = cur.fetchall()
     cur.close()
     return (rv[0] if rv else None) if one else rv
 
 
+def connect_db():
+    """
+    Open a connection in WAL mode, where readers do not block the writer and the writer does not block readers.
+    Writers wait for each other up to DATABASE_TIMEOUT seconds. Applies missing schema migrations.
+    :return: The connection.
+    """
+    db = sql.connect(DATABASE, timeout=DATABASE_TIMEOUT)
+    db.execute('PRAGMA journal_mode=WAL;')
+    db.execute('PRAGMA synchronous={};'.format(DATABASE_SYNCHRONOUS))
+    migrate_db(db)
+    return db
+
+
 def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sql.connect(DATABASE)
+    """
+    Get the connection of the current thread, opening it on first use. Connections are not inherited across forks.
+    :return: The connection.
+    """
+    db = getattr(local_db, 'connection', None)
+    if db is None or local_db.pid != os.getpid():
+        db = local_db.connection = connect_db()
+        local_db.pid = os.getpid()
+        local_db.progress_cache = None
     return db
 
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    # the connection stays open for the next request of the thread, but nothing uncommitted may leak into it
+    db = getattr(local_db, 'connection', None)
+    if db is not None and local_db.pid == os.getpid() and db.in_transaction:
+        db.rollback()
 
 
 def fill_annotated_rows_from_db(from_db_path):
     """
     Fill the rows of the current, new database with annotated rows from a different database.
     Useful for transferring data from one SQLITE database to the other.
+    The unannotated ('None') row of every example annotated in the other database becomes an 'anon' row with the
+    annotation, merged through an attached database in one transaction.
     :param from_db_path: Path to the database to transfer from.
     :return: None
     """
     with app.app_context():
-        from_db = sql.connect(from_db_path)
-        from_db.row_factory = namedtuple_factory
-        query = 'SELECT * FROM annotations WHERE is_annotated=1;'
-        cur = from_db.execute(query)
-        rows = cur.fetchall()
-        cur.close()
-
-        for row in rows:
-            insert_db('UPDATE annotations '
-                      'SET username=?, talk_id=?, term_id=?, real_id=?, link=?, german_ctx=?, english_ctx=?, gloss_ctx=?, german=?, english=?, gloss=?, en_ctx_h=?, gl_ctx_h=?, en_h=?, gl_h=?, confidence=?, is_annotated=? '
-                      'WHERE username=? AND talk_id=? AND term_id=?;',
-                      ('anon', row.talk_id, row.term_id, row.real_id, row.link, row.german_ctx, row.english_ctx, row.gloss_ctx, row.german, row.english, row.gloss, row.en_ctx_h, row.gl_ctx_h, row.en_h, row.gl_h, row.confidence, row.is_annotated,
-                       'None', row.talk_id, row.term_id)
-                      )
+        db = get_db()
+        db.execute('ATTACH DATABASE ? AS from_db;', (from_db_path,))
+        try:
+            with db:
+                db.execute(
+                    """INSERT OR IGNORE INTO annotations (username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence, is_annotated)
+                    SELECT 'anon', o.talk_id, o.term_id, o.real_id, o.link, o.german_ctx, o.english_ctx, o.gloss_ctx, o.german, o.english, o.gloss, o.en_ctx_h, o.gl_ctx_h, o.en_h, o.gl_h, o.confidence, o.is_annotated
+                    FROM from_db.annotations AS o
+                    WHERE o.is_annotated=1 AND EXISTS (
+                        SELECT 1 FROM annotations AS n WHERE n.username='None' AND n.talk_id=o.talk_id AND n.term_id=o.term_id);""")
+                db.execute(
+                    """DELETE FROM annotations
+                    WHERE username='None' AND EXISTS (
+                        SELECT 1 FROM from_db.annotations AS o
+                        WHERE o.is_annotated=1 AND o.talk_id=annotations.talk_id AND o.term_id=annotations.term_id);""")
+        finally:
+            db.execute('DETACH DATABASE from_db;')
 
 
 """ ANNOTATION-SPECIFIC CODE """
@@ -203,48 +271,200 @@ def load_sentences_from_files(cur_src, cur_tgt, prev_src, prev_tgt):
 
 def read_data(data):
     """
-    Load a list of parallel sentences with source terms labeled with BIO tags from files.
+    Load parallel sentences with source terms labeled with BIO tags from files, one talk file at a time.
     :param src_bio_dir: Directory with source sentences, each word has a BIO tag
     :param trans_dir: Directory with translator's sentences
     :param b_dir: Directory with Brank interpreter's sentences
     :param a_dir: Directory with Arank interpreter's sentences
     :param s_dir: Directory with Srank interpreter's sentences
-    :return: A list of UnannotatedSentence namedtuples, each contains a `row' of information to put in the database.
+    :return: A generator of UnannotatedSentence namedtuples, each contains a `row' of information to put in the database.
     """
-    sents_to_annotate = []
     for talk_id in range(NUM_TALKS):
         data_path = f"{data}{str(talk_id+1)}.json"
         with open(data_path, 'r') as file:
             all_sents = json.load(file)
         for term_id, sample in all_sents.items():
-            sents_to_annotate.append(UnannotatedSentence(talk_id, term_id, sample['video_id'], sample['video_link'], \
+            yield UnannotatedSentence(talk_id, term_id, sample['video_id'], sample['video_link'], \
                                     "<br><br>".join(sample['german_ctx']), "<br><br>".join(sample['english_ctx']), "<br><br>".join(sample['gloss_ctx']), \
-                                    sample['german'], sample['english'], sample['gloss']))
-    return sents_to_annotate
+                                    sample['german'], sample['english'], sample['gloss'])
 
 def fill_db(sents_to_annotate):
     """
     Init a database with (username, talk_id, term_id) primary key
-    :param sents_to_annotate: A list of tuples of
+    All rows are inserted with one executemany in a single transaction, consuming the sentences as they are read.
+    :param sents_to_annotate: An iterable of UnannotatedSentence tuples, such as read_data returns
     :return: None
     """
-    annotated_translation_type = None
     is_annotated = 0
     username = 'None'
     with app.app_context():
-            for (talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss) in sents_to_annotate:
-                insert_db(
-                    """INSERT INTO annotations (username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence, is_annotated
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);""",
-                    (username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, None, None, None, None, None, is_annotated)
-                )
+        db = get_db()
+        with db:
+            db.executemany(
+                """INSERT INTO annotations (username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence, is_annotated
+                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);""",
+                ((username, talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss, None, None, None, None, None, is_annotated)
+                 for (talk_id, term_id, real_id, link, german_ctx, english_ctx, gloss_ctx, german, english, gloss) in sents_to_annotate)
+            )
+
+""" WORK QUEUE CODE """
+class RowCache:
+    """ A bounded LRU cache of the examples to annotate (the rows of username "None"), by (talk_id, term_id) """
+    def __init__(self, size):
+        self.size = size
+        self.rows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, talk_id, term_id):
+        with self.lock:
+            row = self.rows.get((talk_id, term_id))
+            if row is not None:
+                self.rows.move_to_end((talk_id, term_id))
+            return row
+
+    def put(self, rows):
+        with self.lock:
+            for row in rows:
+                self.rows[(row.talk_id, row.term_id)] = row
+                self.rows.move_to_end((row.talk_id, row.term_id))
+            while len(self.rows) > self.size:
+                self.rows.popitem(last=False)
+
+
+row_cache = RowCache(ROW_CACHE_SIZE)
+
+
+def get_example(talk_id, term_id):
+    """
+    Get an example to annotate, from the cache or else with the next QUEUE_PREFETCH examples of its talk.
+    :param talk_id: An integer index of the talk.
+    :param term_id: The term id of the example.
+    :return: A Row namedtuple.
+    """
+    row = row_cache.get(talk_id, term_id)
+    if row is None:
+        rows = query_db('SELECT * FROM annotations WHERE username="None" AND talk_id=? AND term_id>=? '
+                        'ORDER BY term_id LIMIT ?;',
+                        (talk_id, term_id, QUEUE_PREFETCH))
+        row_cache.put(rows)
+        row = rows[0] if rows and rows[0].term_id == term_id else None
+    return row
+
+
+def get_queue_row(username, talk_id, turn_id):
+    """
+    Get the example at a position of a user's queue of a talk. The queue holds the examples of the talk in term_id
+    order, users annotate them in this order: the examples they annotated come first, then the remaining ones.
+    Only term ids are looked up (on indexes), the example itself usually comes from the cache.
+    :param username: A username string.
+    :param talk_id: An integer index of the talk.
+    :param turn_id: The position in the queue.
+    :return: A Row namedtuple, or None if the queue is shorter.
+    """
+    num_annotated, last_term_id = query_db(
+        'SELECT COUNT(*), MAX(term_id) '
+        'FROM annotations '
+        'WHERE username=? AND talk_id=? AND is_annotated=1;',
+        (username, talk_id), one=True, return_namedtuple=False)
+    if turn_id < num_annotated:
+        # an example the user annotated before
+        term_ids = query_db('SELECT term_id FROM annotations WHERE username=? AND talk_id=? AND is_annotated=1 '
+                            'ORDER BY term_id LIMIT 1 OFFSET ?;',
+                            (username, talk_id, turn_id), return_namedtuple=False)
+    elif num_annotated == 0:
+        term_ids = query_db('SELECT term_id FROM annotations WHERE username="None" AND talk_id=? '
+                            'ORDER BY term_id LIMIT 1 OFFSET ?;',
+                            (talk_id, turn_id), return_namedtuple=False)
+    else:
+        # keyset pagination after the last example the user annotated
+        term_ids = query_db('SELECT term_id FROM annotations WHERE username="None" AND talk_id=? AND term_id>? '
+                            'ORDER BY term_id LIMIT 1 OFFSET ?;',
+                            (talk_id, last_term_id, turn_id - num_annotated), return_namedtuple=False)
+    if not term_ids:
+        return None
+    return get_example(talk_id, term_ids[0][0])
+
+
+""" PROGRESS CODE """
+def get_progress_cache():
+    """
+    Get the progress counts cached by the current thread. They are dropped whenever another connection, of any
+    thread or process, committed since they were counted (PRAGMA data_version); the thread's own writes drop them
+    through invalidate_progress.
+    :return: A dictionary of cached counts.
+    """
+    version = get_db().execute('PRAGMA data_version;').fetchone()[0]
+    if local_db.progress_cache is None or local_db.progress_version != version:
+        local_db.progress_cache = dict()
+        local_db.progress_version = version
+    return local_db.progress_cache
+
+
+def get_progress(username):
+    """
+    Count the completed and total examples of every talk for a user, with one GROUP BY query each.
+    The counts are cached until the database changes, see get_progress_cache.
+    :param username: A username string.
+    :return: A dictionary mapping talk ids to the number of examples annotated by the user, and a dictionary mapping
+    talk ids to the number of examples to annotate.
+    """
+    progress_cache = get_progress_cache()
+    completed = progress_cache.get(('completed', username))
+    if completed is None:
+        completed = defaultdict(int, query_db(
+            'SELECT talk_id, COUNT(*) '
+            'FROM annotations '
+            'WHERE username=? AND is_annotated=1 '
+            'GROUP BY talk_id;',
+            (username,), return_namedtuple=False))
+        progress_cache[('completed', username)] = completed
+    total = progress_cache.get(('total',))
+    if total is None:
+        total = defaultdict(int, query_db(
+            'SELECT talk_id, COUNT(*) '
+            'FROM annotations '
+            'WHERE username="None" '
+            'GROUP BY talk_id;',
+            return_namedtuple=False))
+        progress_cache[('total',)] = total
+    return completed, total
+
+
+def get_status():
+    """
+    Count the rows of every annotator and of the whole table, with one GROUP BY query and one COUNT.
+    The counts are cached until the database changes, see get_progress_cache.
+    :return: A list of (username, number of rows) tuples and the total number of rows.
+    """
+    progress_cache = get_progress_cache()
+    status = progress_cache.get(('status',))
+    if status is None:
+        usernames_and_num_annotated = query_db(
+            'SELECT username, COUNT(*) '
+            'FROM annotations '
+            'WHERE username != ? '
+            'GROUP BY username;',
+            ('None',), return_namedtuple=False)
+        total_annotations_required = query_db('SELECT COUNT(*) FROM annotations;',
+                                              return_namedtuple=False)[0][0]
+        status = (usernames_and_num_annotated, total_annotations_required)
+        progress_cache[('status',)] = status
+    return status
+
+
+def invalidate_progress(username):
+    """ Drop the cached counts which change when a user annotates an example """
+    progress_cache = get_progress_cache()
+    progress_cache.pop(('completed', username), None)
+    progress_cache.pop(('status',), None)
 
-def get_num_annotated():
+
+def get_num_annotated(talk_id):
     return query_db(
             'SELECT COUNT(*) '
             'FROM annotations '
             'WHERE talk_id=? AND username=? AND is_annotated=1;',
-            (user_talkid[g.user], g.user, ), return_namedtuple=False)[0][0]
+            (talk_id, g.user, ), return_namedtuple=False)[0][0]
 
 @app.route('/')
 @login_required
@@ -254,21 +474,12 @@ def home():
     :return: The rendered html template
     """
     print("USER ", g.user)
-    if g.user not in user_data:
-        user_data[g.user] = load_users_data(g.user)
+    completed, total = get_progress(g.user)
     num_completed = dict()
     num_total = dict()
     for i in range(NUM_TALKS):
-        num_completed['completed' + str(i)] = query_db(
-            'SELECT COUNT(*) '
-            'FROM annotations '
-            'WHERE talk_id=? AND username=? AND is_annotated=1;',
-            (i,g.user,), return_namedtuple=False)[0][0]
-        num_total['total' + str(i)] = query_db(
-            'SELECT COUNT(*) '
-            'FROM annotations '
-            'WHERE talk_id=? AND username="None"',
-            (i,), return_namedtuple=False)[0][0]
+        num_completed['completed' + str(i)] = completed[i]
+        num_total['total' + str(i)] = total[i]
     num_completed['completed'] = sum(num_completed.values())
     num_total['total'] = sum(num_total.values())
     return render_template('home.html', **num_completed, **num_total)
@@ -305,7 +516,7 @@ def turn(talk_id, turn_id):
     :param talk_id: An integer index of the talk we are pulling sentences from.
     :return: The rendered html template
     """
-    cur_turn = get_num_annotated()
+    cur_turn = get_num_annotated(talk_id)
     num_total = query_db(
             'SELECT COUNT(*) '
             'FROM annotations '
@@ -315,30 +526,24 @@ def turn(talk_id, turn_id):
         print('Skipped tasks')
         flash('You have not yet annotated example {}. Please annotate example {}.'.format(cur_turn+1, cur_turn+1))
         return redirect(url_for('turn', talk_id=talk_id, turn_id=cur_turn))
-    global user_data
-    user_talkid[g.user] = talk_id
-    if g.user not in user_turnid:
-        user_turnid[g.user] = dict()
-    user_turnid[g.user][talk_id] = turn_id
-
-    try:
-        next_row = user_data[g.user][talk_id][turn_id]
-        return render_template('task.html',
-                            german_ctx=next_row.german_ctx,
-                            english_ctx=next_row.english_ctx,
-                            gloss_ctx=next_row.gloss_ctx,
-                            german=next_row.german,
-                            english=next_row.english,
-                            gloss=next_row.gloss,
-                            id_task=talk_id+1,
-                            id_turn=turn_id + 1,
-                            real_id=next_row.real_id,
-                            link=next_row.link,
-                            talk_id=next_row.talk_id,
-                            num_remaining=num_total - cur_turn
-                            )
-    except:
+    next_row = get_queue_row(g.user, talk_id, turn_id)
+    if next_row is None:
         return home()
+    return render_template('task.html',
+                        german_ctx=next_row.german_ctx,
+                        english_ctx=next_row.english_ctx,
+                        gloss_ctx=next_row.gloss_ctx,
+                        german=next_row.german,
+                        english=next_row.english,
+                        gloss=next_row.gloss,
+                        id_task=talk_id+1,
+                        id_turn=turn_id + 1,
+                        real_id=next_row.real_id,
+                        link=next_row.link,
+                        talk_id=next_row.talk_id,
+                        turn_id=turn_id,
+                        num_remaining=num_total - cur_turn
+                        )
 
 @app.route('/tasks/<int:talk_id>', methods=["GET"])
 @login_required
@@ -349,9 +554,7 @@ def task(talk_id):
     :param talk_id: An integer index of the talk we are pulling sentences from.
     :return: The rendered html template
     """
-    global user_data
-    user_talkid[g.user] = talk_id
-    cur_turn = get_num_annotated()
+    cur_turn = get_num_annotated(talk_id)
     num_total = query_db(
             'SELECT COUNT(*) '
             'FROM annotations '
@@ -401,11 +604,20 @@ def tag_highlight_words(sen):
 def add_row():
     """
     Update the SQLITE database with the annotated parallel sentence which we retrieve from a request form.
+    The form names the talk and turn of the example it shows, so that every tab saves its own example.
     :return: The rendered html template
     """
-    global user_data
-    row = user_data[g.user][user_talkid[g.user]][user_turnid[g.user][user_talkid[g.user]]]
     outd = request.form.to_dict()
+    talk_id = request.form.get('talk_id', type=int)
+    turn_id = request.form.get('turn_id', type=int)
+    if talk_id is None or turn_id is None:
+        abort(400)
+    if turn_id > get_num_annotated(talk_id):
+        flash('You have not yet annotated the previous examples of Task {}.'.format(talk_id+1))
+        return redirect(url_for('task', talk_id=talk_id))
+    row = get_queue_row(g.user, talk_id, turn_id)
+    if row is None:
+        return redirect(url_for('task', talk_id=talk_id))
     button_id = outd['button_id']
     en_ctx_h = tag_highlight_words(outd['english_ctx'])
     gl_ctx_h = tag_highlight_words(outd['gloss_ctx']) 
@@ -419,7 +631,8 @@ def add_row():
                     (g.user, row.talk_id, row.term_id, row.real_id, row.link, row.german_ctx, row.english_ctx, row.gloss_ctx, row.german, row.english, row.gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence, 1,
                       row.german_ctx, row.english_ctx, row.gloss_ctx, row.german, row.english, row.gloss, en_ctx_h, gl_ctx_h, en_h, gl_h, confidence)
                 )
-    return redirect(url_for('task', talk_id=user_talkid[g.user]))
+    invalidate_progress(g.user)
+    return redirect(url_for('task', talk_id=talk_id))
 
 
 @app.route('/status', methods=["GET"])
@@ -429,33 +642,13 @@ def status():
     Use this hidden webpage for checking the status of the annotation process
     :return: The rendered html template.
     """
-    usernames = [tup[0] for tup in query_db('SELECT DISTINCT username FROM annotations WHERE username != ?;', ('None',),
-                                            return_namedtuple=False)]
-    num_annotated = []
-    for username in usernames:
-        num_annotated.append(query_db('SELECT COUNT(*) FROM annotations WHERE username=?;', (username,),
-                             return_namedtuple=False)[0][0])
-    total_num_annotated = sum(num_annotated)
-    total_annotations_required = query_db('SELECT COUNT(*) FROM annotations;', return_namedtuple=False)[0][0]
-    return render_template('status.html', usernames_and_num_annotated=list(zip(usernames, num_annotated)),
+    usernames_and_num_annotated, total_annotations_required = get_status()
+    total_num_annotated = sum(num_annotated for _, num_annotated in usernames_and_num_annotated)
+    return render_template('status.html', usernames_and_num_annotated=usernames_and_num_annotated,
                            total_num_annotated=total_num_annotated,
                            total_annotations_required=total_annotations_required)
 
 
-def load_users_data(username):
-    """
-    Return a user's data to be stored in their entry in the user_data dictionary
-    :param username: A username string.
-    :return: A list of deques of size NUM_TALKS. Each element in the deque is a Row namedtuple obtained from the
-    SQLITE database.
-    """
-    print('Loading user data into memory for username:', username)
-    with app.app_context():
-        tbl_data = query_db('SELECT * FROM annotations WHERE username="None" ORDER BY term_id;')
-    # load into list of deques, one per talk (number of separate categories) to annotate
-    return [deque([row for row in tbl_data if row.talk_id == i]) for i in range(NUM_TALKS)]
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Annotation interface.')
     parser.add_argument('-data', type=str, help='Path to the json data file')
@@ -469,8 +662,7 @@ if __name__ == '__main__':
 
     if args.init_db:
         init_db()
-        sents_to_annotate = read_data(args.data)
-        fill_db(sents_to_annotate)
+        fill_db(read_data(args.data))
         if args.from_db:
             fill_annotated_rows_from_db(args.from_db)
         exit(0)
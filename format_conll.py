@@ -1,43 +1,59 @@
 import argparse
+import html
 import json
-from bs4 import BeautifulSoup
+import re
+import sys
 
-def format_answer(data):
-    with open(args.data, "r") as file:
-        data = file.readlines()
+# the <mention ...>text</mention> markup written by Document.to_simple_output
+MENTION = re.compile(r'<mention\b([^>]*)>(.*?)</mention\s*>', re.S)
+ATTRIBUTE = re.compile(r'([^\s=]+)\s*=\s*"([^"]*)"')
 
-    soups = [BeautifulSoup(d, 'html.parser') for d in data]
 
-    is_first = True
-    doc_id = -1
-    sent_id = 0
-    for soup in soups:
-        sent_id += 1
-        for gloss_id, mention in enumerate(soup.find_all('mention')):
-            if mention["id"] == "0":
-                entity_map = {}
-                doc_id += 1
-                if is_first:
-                    print(f"#begin document ({mention['document_id']}); ")
-                    is_first = False
-                else:
-                    print("#end document")
-                    sent_id = 1
-                    print(f"#begin document ({mention['document_id']}); ")
-            try:
-                entity = mention['entity']
-                if entity in entity_map:
-                    entity = entity_map[entity]
+def scan_mentions(line):
+    """ Scan the mentions of one line of Document.to_simple_output.
+    Args:
+        line (str): One sentence, as written by Document.to_simple_output.
+    Returns:
+        An iterator over (attributes, text) pairs, where attributes is a
+        dict(str, str) of the (unescaped) tag attributes and text the
+        (unescaped) content of the tag.
+    """
+    for match in MENTION.finditer(line):
+        attributes = {name.lower(): html.unescape(value)
+                      for name, value in ATTRIBUTE.findall(match.group(1))}
+        yield attributes, html.unescape(match.group(2))
+
+
+def format_answer(data, out=sys.stdout):
+    with open(data, "r") as file:
+        is_first = True
+        doc_id = -1
+        sent_id = 0
+        for line in file:
+            sent_id += 1
+            for gloss_id, (mention, text) in enumerate(scan_mentions(line)):
+                if mention["id"] == "0":
+                    entity_map = {}
+                    doc_id += 1
+                    if is_first:
+                        out.write(f"#begin document ({mention['document_id']}); \n")
+                        is_first = False
+                    else:
+                        out.write("#end document\n")
+                        sent_id = 1
+                        out.write(f"#begin document ({mention['document_id']}); \n")
+                entity = mention.get('entity')
+                if entity is not None:
+                    if entity in entity_map:
+                        entity = entity_map[entity]
+                    else:
+                        entity_map[entity] = len(entity_map)
+                        entity = entity_map[entity]
+                    out.write(f"test{sent_id}\t{doc_id}\t{gloss_id}\t{text}\t({entity})\n")
                 else:
-                    entity_map[entity] = len(entity_map)
-                    entity = entity_map[entity]
-                print(f"test{sent_id}	{doc_id}	{gloss_id}	{mention.text}	({entity})")
-            except:
-                print(f"test{sent_id}	{doc_id}	{gloss_id}	{mention.text}	-")
-        print()
-    print("#end document")
-            
-    
+                    out.write(f"test{sent_id}\t{doc_id}\t{gloss_id}\t{text}\t-\n")
+            out.write("\n")
+        out.write("#end document\n")
 
 
 def format_key(data):
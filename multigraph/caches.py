@@ -0,0 +1,172 @@
+""" Binary cache of parsed corpora for fast repeated runs."""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from multigraph import features
+from multigraph.documents import Document
+
+FORMAT_VERSION = 2
+
+# columns of all documents are concatenated, each into one .npy file
+COLUMNS = Document.PAYLOAD_ARRAYS + ("sentence_bounds",)
+META_FILE = "meta.json"
+
+
+def default_cache_path(source):
+    return source + ".cache"
+
+
+def source_hash(source):
+    """ Compute the sha256 hex digest of a file's content. """
+    digest = hashlib.sha256()
+    with open(source, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_cache(documents, source, cache_path=None):
+    """ Write the parsed documents of a file to a cache directory.
+    The cache contains one memory-mappable .npy file per document column
+    (with the columns of all documents concatenated), the token and
+    sentence offsets of every document, and a json file with the interned
+    gloss and signer tables, the document identifiers, the format version
+    and the hash of the source file.
+    Args:
+        documents (iterable(Document)): The documents parsed from source.
+        source (str): The path of the file the documents were parsed from.
+        cache_path (str): The cache directory, defaults to source + ".cache".
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(source)
+    os.makedirs(cache_path, exist_ok=True)
+
+    vocabulary = {}
+    signers = {}
+    identifiers = []
+    columns = {name: [] for name in COLUMNS}
+    token_offsets = [0]
+    sentence_offsets = [0]
+
+    for document in documents:
+        payload = document.to_payload()
+        # map document-local gloss and signer ids to corpus-wide ones
+        gloss_map = np.array([vocabulary.setdefault(gloss, len(vocabulary))
+                              for gloss in payload["vocabulary"]],
+                             dtype=np.int32)
+        signer_map = np.array([signers.setdefault(signer, len(signers))
+                               for signer in payload["signers"]],
+                              dtype=np.int32)
+        payload["gloss_ids"] = gloss_map[payload["gloss_ids"]]
+        payload["signer_ids"] = signer_map[payload["signer_ids"]]
+
+        identifiers.append(payload["identifier"])
+        for name in COLUMNS:
+            columns[name].append(payload[name])
+        token_offsets.append(token_offsets[-1] + len(payload["gloss_ids"]))
+        sentence_offsets.append(sentence_offsets[-1] +
+                                len(payload["sentence_bounds"]))
+
+    for name in COLUMNS:
+        if columns[name]:
+            column = np.concatenate(columns[name])
+        else:
+            column = np.zeros(0)
+        np.save(os.path.join(cache_path, name + ".npy"), column)
+    np.save(os.path.join(cache_path, "token_offsets.npy"),
+            np.array(token_offsets, dtype=np.int64))
+    np.save(os.path.join(cache_path, "sentence_offsets.npy"),
+            np.array(sentence_offsets, dtype=np.int64))
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "source_sha256": source_hash(source),
+        "identifiers": identifiers,
+        "vocabulary": list(vocabulary),
+        "signers": list(signers),
+    }
+    # the meta file is written last, so an interrupted write is never fresh
+    meta_path = os.path.join(cache_path, META_FILE)
+    with open(meta_path + ".tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def load_cache(source, cache_path=None):
+    """ Load the cache of a file if it is fresh.
+    Args:
+        source (str): The path of the file the cache was created from.
+        cache_path (str): The cache directory, defaults to source + ".cache".
+    Returns:
+        CorpusCache: The cache, or None if there is no cache, or it was
+        written by another format version or from a different file content.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(source)
+
+    meta_path = os.path.join(cache_path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, "r") as file:
+        meta = json.load(file)
+
+    if meta.get("format_version") != FORMAT_VERSION or \
+            meta.get("source_sha256") != source_hash(source):
+        return None
+
+    return CorpusCache(cache_path, meta)
+
+
+class CorpusCache:
+    """ A loaded corpus cache.
+    The columns are memory-mapped, documents built from the cache share
+    their arrays with the cache and the interned tables with each other.
+    Attributes:
+        identifiers (list(str)): The identifiers of the documents, in the
+            order of the source file.
+        vocabulary (list(str)): The corpus-wide gloss table.
+        signers (list(str)): The corpus-wide signer table.
+    """
+    def __init__(self, cache_path, meta):
+        self.identifiers = meta["identifiers"]
+        self.vocabulary = meta["vocabulary"]
+        self.signers = meta["signers"]
+
+        def load(name):
+            return np.load(os.path.join(cache_path, name + ".npy"),
+                           mmap_mode="r")
+
+        self.columns = {name: load(name) for name in COLUMNS}
+        # classify the corpus-wide gloss table once for all documents
+        self.gloss_codes = features.GLOSSES.lookup_all(self.vocabulary)
+        self.token_offsets = load("token_offsets")
+        self.sentence_offsets = load("sentence_offsets")
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __iter__(self):
+        """ Build the documents of the cache one at a time.
+        Returns:
+            An iterator over the documents, in the order of the source file.
+        """
+        for i, identifier in enumerate(self.identifiers):
+            tokens = slice(self.token_offsets[i], self.token_offsets[i+1])
+            sentences = slice(self.sentence_offsets[i],
+                              self.sentence_offsets[i+1])
+
+            payload = {name: self.columns[name][tokens]
+                       for name in Document.PAYLOAD_ARRAYS}
+            payload["sentence_bounds"] = \
+                self.columns["sentence_bounds"][sentences]
+            payload["identifier"] = identifier
+            payload["vocabulary"] = self.vocabulary
+            payload["gloss_codes"] = self.gloss_codes
+            payload["signers"] = self.signers
+
+            yield Document.from_payload(payload)
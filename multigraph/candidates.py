@@ -0,0 +1,297 @@
+""" Generate candidate antecedents for the mentions of a document."""
+
+import numpy as np
+
+from multigraph import features
+from multigraph.grids import GridIndex
+
+# gloss classes of the antecedents a pronoun-like anaphor can be linked to
+PRONOUN_BUCKETS = {
+    features.I_CLASS: (features.I_CLASS, features.YOU_CLASS),
+    features.YOU_CLASS: (features.I_CLASS, features.YOU_CLASS),
+    features.INDEX_CLASS: (features.INDEX_CLASS,),
+}
+
+NUM_CLASSES = features.NUM_CLASSES
+
+
+def feature_support(model_features):
+    """ Compute the candidate antecedents the features of a model can have
+    a positive weight for (see features.POSITIVE_SUPPORT).
+    Args:
+        model_features (list(function)): The features of a model.
+    Returns:
+        dict(int, tuple((int, int, int, float))): A mapping of anaphor
+        gloss classes to the (antecedent gloss class, signer relation, token
+        window, radius) combinations of the candidates which are not
+        immediately preceding the anaphor. None if the support of some
+        feature is unknown.
+    """
+    support = {}
+    for feature in model_features:
+        if feature not in features.POSITIVE_SUPPORT:
+            return None
+        combinations = features.POSITIVE_SUPPORT[feature]
+        # immediately preceding mentions are always candidates
+        if combinations == features.ADJACENT:
+            continue
+        for anaphor_class, *combination in combinations:
+            combination = tuple(combination)
+            if combination not in support.setdefault(anaphor_class, ()):
+                support[anaphor_class] += (combination,)
+    return support
+
+
+class CandidateGenerator:
+    """ Compute the sets of candidate antecedents the multigraph connects
+    each mention to.
+
+    Without any restriction every mention is connected to all preceding
+    mentions (except for the first mention of the document), which is the
+    full graph. The candidate sets can be pruned by a token window, a time
+    window, gloss-class buckets and the support of the features. The
+    mentions immediately preceding an anaphor are always kept.
+
+    Attributes:
+        token_window (int): If set, keep only antecedents which end fewer
+            than token_window tokens before the anaphor begins.
+        time_window (int): If set, keep only antecedents which end less
+            than time_window (in the unit of the gloss timestamps) before
+            the anaphor starts.
+        buckets (dict(int, tuple(int))): If set, a mapping of anaphor gloss
+            classes to the gloss classes of antecedents they may be linked
+            to. Anaphors of a class not in the mapping only keep their
+            immediately preceding mentions.
+        support (dict(int, tuple((int, int, int, float)))): If set, a
+            mapping of anaphor gloss classes to the combinations of
+            antecedent gloss class, signer relation (features.SAME_SIGNER or
+            features.OTHER_SIGNER), token window and radius (None if
+            unbounded) of the antecedents they may be linked to, see
+            feature_support. Combinations with a radius are looked up in
+            grids over the hand positions of the antecedents.
+            Anaphors of a class not in the mapping only keep their
+            immediately preceding mentions.
+        adjacent (int): The number of immediately preceding mentions that
+            are always candidates.
+        num_candidates (int): The number of edges generated so far.
+        num_pruned (int): The number of edges of the full graph that were
+            pruned so far.
+    """
+    def __init__(self, token_window=None, time_window=None, buckets=None,
+                 support=None, adjacent=1):
+        self.token_window = token_window
+        self.time_window = time_window
+        self.buckets = buckets
+        self.support = support
+        self.adjacent = adjacent
+
+        self.num_candidates = 0
+        self.num_pruned = 0
+
+    def is_full(self):
+        return self.token_window is None and self.time_window is None \
+            and self.buckets is None and self.support is None
+
+    def generate(self, arrays):
+        """ Compute the candidate antecedents of all mentions of a document.
+        Args:
+            arrays (MentionArrays): Arrays describing the mentions of the
+                document, in document order.
+        Returns:
+            (np.ndarray, np.ndarray): The candidates in compressed row
+            format: the candidates of mention i are
+            ``antecedents[indptr[i]:indptr[i+1]]``, ordered from the closest
+            to the farthest one.
+        """
+        n = len(arrays)
+
+        if self.is_full():
+            indptr, antecedents = CandidateGenerator.__full(n)
+            self.num_candidates += len(antecedents)
+            return indptr, antecedents
+
+        rows = self.for_document(arrays)
+        antecedents = [rows.row(i) for i in range(n)]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in antecedents], out=indptr[1:])
+
+        if n == 0:
+            return indptr, np.zeros(0, dtype=np.int64)
+
+        return indptr, np.concatenate(antecedents)
+
+    def for_document(self, arrays):
+        """ Prepare computing the candidates of a document one mention at a
+        time.
+        Args:
+            arrays (MentionArrays): Arrays describing the mentions of the
+                document, in document order.
+        Returns:
+            DocumentCandidates: An object whose ``row(i)`` method returns
+            the candidate antecedents of mention i, closest first.
+        """
+        return DocumentCandidates(self, arrays)
+
+    @staticmethod
+    def __full(n):
+        sizes = np.maximum(np.arange(n, dtype=np.int64) - 1, 0)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+
+        # do not include the first mention
+        rows = np.repeat(np.arange(n, dtype=np.int64), sizes)
+        offsets = np.arange(indptr[-1], dtype=np.int64) - indptr[rows]
+
+        return indptr, rows - 1 - offsets
+
+
+class DocumentCandidates:
+    """ The candidate antecedents of the mentions of one document, computed
+    on demand by ``row(i)``. Only per-mention data is kept, so memory is
+    linear in the number of mentions.
+    """
+    def __init__(self, generator, arrays):
+        self.generator = generator
+        self.arrays = arrays
+
+        n = len(arrays)
+        positions = np.arange(n, dtype=np.int64)
+
+        # first candidate allowed by the windows; antecedents before it are
+        # out of all windows since the running maxima bound their ends
+        lower = np.ones(n, dtype=np.int64)
+        if generator.token_window is not None:
+            lower = np.maximum(lower, np.searchsorted(
+                np.maximum.accumulate(arrays.end),
+                arrays.begin - generator.token_window, side="right"))
+        if generator.time_window is not None:
+            lower = np.maximum(lower, np.searchsorted(
+                np.maximum.accumulate(arrays.end_time),
+                arrays.start_time - generator.time_window, side="right"))
+        self.adjacent_lower = np.maximum(positions - generator.adjacent, 1)
+        self.lower = np.minimum(lower, self.adjacent_lower)
+
+        self.by_class = None
+        if generator.buckets is not None:
+            self.by_class = [np.flatnonzero(arrays.gloss_class == c)
+                             for c in range(NUM_CLASSES)]
+
+        self.by_signer_class = None
+        if generator.support is not None:
+            self.by_signer_class = arrays.get_signer_class_index()
+            self.signers = sorted(set(
+                signer for signer, _ in self.by_signer_class))
+            self.max_end = np.maximum.accumulate(arrays.end)
+            # (signer, class, radius) -> grids over mcp and tip, built on
+            # first use
+            self.grids = {}
+
+    def __get_grids(self, signer, c, radius):
+        key = (signer, c, radius)
+        if key not in self.grids:
+            positions = self.by_signer_class[(signer, c)]
+            self.grids[key] = (
+                GridIndex(positions, self.arrays.mcp[positions], radius),
+                GridIndex(positions, self.arrays.tip[positions], radius))
+        return self.grids[key]
+
+    def __within_radius(self, i, signer, c, radius, begin):
+        arrays = self.arrays
+        mcp_grid, tip_grid = self.__get_grids(signer, c, radius)
+        positions = np.union1d(mcp_grid.query(arrays.mcp[i], begin, i),
+                               tip_grid.query(arrays.tip[i], begin, i))
+
+        # keep pairs within the radius in mcp or tip, with some slack for
+        # rounding; extra candidates are harmless
+        limit = radius * (1 + 1e-9)
+        return positions[
+            (np.hypot(*(arrays.mcp[positions] - arrays.mcp[i]).T) <= limit) |
+            (np.hypot(*(arrays.tip[positions] - arrays.tip[i]).T) <= limit)]
+
+    def __allowed(self, i):
+        """ Get the sorted positions of the candidates of mention i (not
+        counting the immediately preceding ones) in the classes, signers,
+        windows and radii it may be linked to. """
+        generator = self.generator
+        arrays = self.arrays
+        anaphor_class = arrays.gloss_class[i]
+
+        if self.by_signer_class is None:
+            return [positions[np.searchsorted(positions, self.lower[i]):
+                              np.searchsorted(positions, i)]
+                    for positions in (
+                        self.by_class[c]
+                        for c in generator.buckets.get(anaphor_class, ()))]
+
+        anaphor_signer = arrays.signer[i]
+        allowed = []
+        for c, signers, token_window, radius in \
+                generator.support.get(anaphor_class, ()):
+            if generator.buckets is not None and \
+                    c not in generator.buckets.get(anaphor_class, ()):
+                continue
+
+            begin = self.lower[i]
+            if token_window is not None:
+                begin = max(begin, np.searchsorted(
+                    self.max_end, arrays.begin[i] - token_window,
+                    side="right"))
+
+            for signer in self.signers:
+                if (signer == anaphor_signer) != \
+                        (signers == features.SAME_SIGNER) or \
+                        (signer, c) not in self.by_signer_class:
+                    continue
+
+                if radius is None:
+                    positions = self.by_signer_class[(signer, c)]
+                    positions = positions[np.searchsorted(positions, begin):
+                                          np.searchsorted(positions, i)]
+                else:
+                    positions = self.__within_radius(i, signer, c, radius,
+                                                     begin)
+
+                if token_window is not None:
+                    positions = positions[arrays.begin[i] -
+                                          arrays.end[positions] < token_window]
+                allowed.append(positions)
+        return allowed
+
+    def row(self, i):
+        """ Compute the candidate antecedents of mention i.
+        Args:
+            i (int): The position of the anaphor in the document.
+        Returns:
+            np.ndarray: The positions of the candidates, closest first.
+        """
+        generator = self.generator
+        arrays = self.arrays
+
+        if generator.is_full():
+            # do not include the first mention
+            candidates = np.arange(i - 1, 0, -1, dtype=np.int64)
+            generator.num_candidates += len(candidates)
+            return candidates
+
+        if self.by_class is None and self.by_signer_class is None:
+            candidates = np.arange(self.lower[i], i, dtype=np.int64)
+        else:
+            parts = [np.arange(self.adjacent_lower[i], i, dtype=np.int64)]
+            parts += self.__allowed(i)
+            candidates = np.unique(np.concatenate(parts))
+
+        keep = candidates >= self.adjacent_lower[i]
+        in_window = np.ones(len(candidates), dtype=bool)
+        if generator.token_window is not None:
+            in_window &= (arrays.begin[i] - arrays.end[candidates]) \
+                < generator.token_window
+        if generator.time_window is not None:
+            in_window &= (arrays.start_time[i] -
+                          arrays.end_time[candidates]) < generator.time_window
+
+        candidates = candidates[keep | in_window][::-1]
+        generator.num_candidates += len(candidates)
+        generator.num_pruned += max(i - 1, 0) - len(candidates)
+
+        return candidates
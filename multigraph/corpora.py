@@ -5,8 +5,44 @@ Adapted from https://github.com/smartschat/cort
 """ Represent and manipulate text collections as a list of documents."""
 
 from collections import defaultdict
+import bz2
+import gzip
 import json
+import lzma
+import re
 from multigraph.documents import Document
+from multigraph import caches
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DELIMITER = re.compile(r"[ \t\n\r,:}\]]")
+
+# compressed output formats, chosen by the file extension
+COMPRESSORS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".lzma": lzma.open,
+}
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+def open_output(filename):
+    """Open a text file for writing, compressed if its name ends in .gz,
+    .bz2, .xz or .lzma.
+
+    Args:
+        filename (str): The path of the file.
+
+    Returns:
+        A buffered text file object.
+    """
+    for extension, compressor in COMPRESSORS.items():
+        if filename.endswith(extension):
+            return compressor(filename, "wt")
+
+    return open(filename, "w", buffering=OUTPUT_BUFFER_SIZE)
+
 
 class Corpus:
     """Represents a text collection (a corpus) as a list of documents.
@@ -38,7 +74,7 @@ class Corpus:
         return iter(self.documents)
 
     @staticmethod
-    def from_file(description, coref_file):
+    def from_file(description, coref_file, use_cache=True):
         """Construct a new corpus from a description and a file.
 
         The file must contain documents in the format for the CoNLL shared
@@ -48,6 +84,9 @@ class Corpus:
         Args:
             description (str): A human-readable description of the corpus.
             coref_file (file): A text file of documents in the CoNLL format.
+            use_cache (bool): Whether to load the documents from the
+                binary cache of the file if it is fresh (see
+                compile_cache).
 
         Returns:
             Corpus: A corpus consisting of the documents described in
@@ -56,13 +95,76 @@ class Corpus:
 
         if coref_file is None:
             return []
-        
-        corpus = json.load(open(coref_file, "r"))
 
-        documents = [Document(vid_id, data) for vid_id, data in corpus.items()]
+        documents = list(Corpus.iter_documents(coref_file,
+                                               use_cache=use_cache))
 
         return Corpus(description, sorted(documents))
 
+    @staticmethod
+    def compile_cache(coref_file, lines=None):
+        """Parse a file and write its binary cache, unless it is fresh.
+
+        The cache is written to coref_file + ".cache" and is used by
+        from_file and iter_documents as long as the content of coref_file
+        does not change.
+
+        Args:
+            coref_file (str): The path of the file.
+            lines (bool): Whether the file is in JSON Lines format, see
+                iter_documents.
+
+        Returns:
+            bool: True if the cache was (re)written, False if it was fresh.
+        """
+        if caches.load_cache(coref_file) is not None:
+            return False
+
+        caches.write_cache(
+            Corpus.iter_documents(coref_file, lines, use_cache=False),
+            coref_file)
+        return True
+
+    @staticmethod
+    def iter_documents(coref_file, lines=None, chunk_size=1 << 16,
+                       use_cache=True):
+        """Read documents one at a time from a file.
+
+        The file is either a json object mapping video ids to document data,
+        which is parsed incrementally, or a JSON Lines file where every line
+        is such an object (usually with a single video id). Documents are
+        yielded in file order.
+
+        Args:
+            coref_file (str): The path of the file.
+            lines (bool): Whether the file is in JSON Lines format. If None,
+                this is decided by the file extension (.jsonl or .ndjson).
+            chunk_size (int): The number of characters to read at once.
+            use_cache (bool): Whether to build the documents from the
+                binary cache of the file if it is fresh.
+
+        Returns:
+            An iterator over the documents in the file.
+        """
+        if use_cache:
+            cache = caches.load_cache(coref_file)
+            if cache is not None:
+                yield from cache
+                return
+
+        if lines is None:
+            lines = coref_file.endswith((".jsonl", ".ndjson"))
+
+        with open(coref_file, "r") as file:
+            if lines:
+                for line in file:
+                    if line.strip():
+                        for vid_id, data in json.loads(line).items():
+                            yield Document(vid_id, data)
+            else:
+                for vid_id, data in _iter_object_items(file, chunk_size):
+                    yield Document(vid_id, data)
+
     def write_to_file(self, file):
         """Write a string representation of the corpus to a file,
 
@@ -70,7 +172,30 @@ class Corpus:
             file (file): The file the corpus should be written to.
         """
         for document in self.documents:
-            file.write(document.to_simple_output())
+            document.write_simple_output(file)
+
+    def write_conll_key(self, file):
+        """Write the annotated coreference of the corpus to a file in the
+        CoNLL format read by scorer.pl.
+
+        Args:
+            file (file): The file the key should be written to.
+        """
+        for index, document in enumerate(self.documents):
+            file.write(document.to_conll_key(index))
+
+    def write_conll_response(self, file):
+        """Write the coreference decisions of the corpus to a file in the
+        CoNLL format read by scorer.pl.
+
+        The output is identical to converting the output of write_to_file
+        with format_conll.py.
+
+        Args:
+            file (file): The file the response should be written to.
+        """
+        for index, document in enumerate(self.documents):
+            file.write(document.to_conll_response(index))
 
     def write_antecedent_decisions_to_file(self, file):
         """Write antecedent decisions in the corpus to a file.
@@ -84,3 +209,73 @@ class Corpus:
         """
         for document in self.documents:
             document.write_antecedent_decisions_to_file(file)
+
+
+def _iter_object_items(file, chunk_size):
+    """Incrementally parse the top-level json object of a file.
+
+    Only the member which is currently parsed is held in memory (plus the
+    unparsed rest of the last chunk read).
+
+    Args:
+        file (file): A text file containing a json object.
+        chunk_size (int): The number of characters to read at once.
+
+    Returns:
+        An iterator over the (key, value) pairs of the object.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        # read at least as much as is buffered to keep parsing linear
+        more = file.read(max(chunk_size, len(buffer) - pos))
+        buffer = buffer[pos:] + more
+        pos = 0
+        eof = not more
+
+    def peek():
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            read_more()
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError("Expected '" + char + "' in json object, found " +
+                             repr(buffer[pos:pos + 20]))
+        pos += 1
+
+    def decode():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # a value may continue in the file unless a delimiter
+                # follows it (a number like 1.5 decodes as 1 from "1.")
+                if eof or DELIMITER.match(buffer, end):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read_more()
+
+    expect("{")
+    if peek() == "}":
+        return
+
+    while True:
+        key = decode()
+        expect(":")
+        yield key, decode()
+        if peek() == "}":
+            return
+        expect(",")
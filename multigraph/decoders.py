@@ -2,59 +2,232 @@
 Adapted from https://github.com/smartschat/cort
 """
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from multigraph.documents import Document
+from multigraph.mentions import Mention
+from multigraph.spans import Span
+
 class MultigraphDecoder:
     def __init__(self, multigraph_creator, graph=True):
         self.coref_multigraph_creator = multigraph_creator
         self.graph = graph
 
-    def decode(self, corpus):
-        for doc in corpus:
-            doc.antecedent_decisions = {}
-            for mention in doc.system_mentions:
-                mention.attributes["set_id"] = None
+    def decode(self, corpus, workers=1):
+        """ Decode all documents of a corpus.
+        Args:
+            corpus (Corpus): The corpus, its documents must have system
+                mentions.
+            workers (int): If greater than 1, decode the documents in a pool
+                of this many processes. The result is the same as when
+                decoding serially.
+        """
+        for _ in self.decode_documents(corpus, workers):
+            pass
+
+    def decode_documents(self, documents, workers=1):
+        """ Decode documents as they are read, for pipelined processing.
+        Args:
+            documents (iterable(Document)): The documents, they must have
+                system mentions.
+            workers (int): If greater than 1, decode the documents in a pool
+                of this many processes. Workers receive the columns of a
+                document and the spans of its system mentions (see
+                Document.to_payload) and send back the set ids and
+                antecedent decisions. At most two documents per worker are
+                in flight.
+        Returns:
+            An iterator over the decoded documents, in input order.
+        """
+        if workers <= 1:
+            for doc in documents:
+                doc.antecedent_decisions = {}
+                for mention in doc.system_mentions:
+                    mention.set_id = None
+
+                # discard dummy mention
+                self.decode_for_one_document(doc.system_mentions[1:])
+                yield doc
+            return
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(self,)) as executor:
+            pending = deque()
+            for doc in documents:
+                pending.append(
+                    (doc, executor.submit(_decode_payload, _to_payload(doc))))
+                if len(pending) >= 2 * workers:
+                    doc, future = pending.popleft()
+                    self.__apply_result(doc, future.result())
+                    yield doc
+
+            while pending:
+                doc, future = pending.popleft()
+                self.__apply_result(doc, future.result())
+                yield doc
+
+    def __apply_result(self, doc, result):
+        set_ids, decisions, num_candidates, num_pruned = result
+        candidates = self.coref_multigraph_creator.candidates
 
-            # discard dummy mention
-            self.decode_for_one_document(doc.system_mentions[1:])
+        for mention in doc.system_mentions:
+            mention.set_id = None
+        for mention, set_id in zip(doc.system_mentions[1:], set_ids):
+            mention.set_id = set_id
+        doc.antecedent_decisions = {
+            Span(*anaphor): Span(*antecedent)
+            for anaphor, antecedent in decisions}
+        candidates.num_candidates += num_candidates
+        candidates.num_pruned += num_pruned
 
-    def decode_for_one_document(self, mentions):
-        multigraph = \
-            self.coref_multigraph_creator.construct_graph_from_mentions(
-                mentions)
+    def decode_for_one_document(self, mentions, multigraph=None):
+        """ Decode the mentions of a document, setting their set ids and the
+        antecedent decisions of the document.
+        Args:
+            mentions (list(Mention)): The mentions of the document, without
+                the dummy mention.
+            multigraph (CorefMultigraph): The graph of the mentions, if it
+                was constructed already.
+        """
+        if multigraph is None:
+            multigraph = \
+                self.coref_multigraph_creator.construct_graph_from_mentions(
+                    mentions)
+        positions = multigraph.positions
 
         for mention in mentions:
             antecedent = self.compute_antecedent(mention, multigraph, self.graph)
 
             if antecedent is not None:
                 if self.graph:
-                    if antecedent.attributes["set_id"] is None:
-                        antecedent.attributes["set_id"] = \
-                            mentions.index(antecedent)
+                    if antecedent.set_id is None:
+                        antecedent.set_id = positions[antecedent]
 
-                    mention.attributes["set_id"] = antecedent.attributes["set_id"]
+                    mention.set_id = antecedent.set_id
                     mention.document.antecedent_decisions[mention.span] = \
                         antecedent.span
 
                 else:
-                    min_set_id = min([ante.attributes["set_id"] if ante.attributes["set_id"] else mentions.index(ante) for ante in antecedent])
+                    min_set_id = min([ante.set_id if ante.set_id else positions[ante] for ante in antecedent])
                     for ante in antecedent:
-                        ante.attributes["set_id"] = min_set_id
+                        ante.set_id = min_set_id
                     
-                    mention.attributes["set_id"] = min_set_id
+                    mention.set_id = min_set_id
                     mention.document.antecedent_decisions[mention.span] = \
                         mentions[min_set_id].span
 
     @staticmethod
     def compute_antecedent(mention, multigraph, graph):
-        weights = []
-        for antecedent in multigraph.edges[mention]:
-            weights.append(
-                (multigraph.get_weight(mention, antecedent), antecedent))
-        
-        # get antecedent with highest positive weight, break ties by distance
-        if len(weights) > 0 and sorted(weights)[-1][0] > 0:
+        """ Compute the antecedent(s) of a mention in a single pass over its
+        edges.
+        The antecedent is the candidate with the highest positive weight,
+        ties are broken in favour of the candidate closest to the mention.
+        Edges with a -inf relation are skipped without summing the remaining
+        relations.
+        Args:
+            mention (Mention): The anaphor.
+            multigraph (CorefMultigraph): The graph of the mention's
+                document.
+            graph (bool): If False, return all candidates with positive
+                weight instead of the best one.
+        Returns:
+            Mention or list(Mention): The antecedent (or antecedents), None
+            if no candidate has positive weight.
+        """
+        if multigraph.edges is None:
+            return MultigraphDecoder.compute_antecedent_from_weights(
+                mention, multigraph, graph)
+
+        positions = multigraph.positions
+
+        best = None
+        best_weight = 0.0
+        best_position = -1
+        positive = []
+
+        for antecedent, relations in multigraph.edges[mention].items():
+            weight = 0.0
+            for relation in relations:
+                if relation == -np.inf:
+                    weight = relation
+                    break
+                weight += relation
+
+            # fails for -inf and nan weights
+            if weight > 0:
+                position = positions[antecedent]
+                if weight > best_weight or (weight == best_weight and
+                                            position > best_position):
+                    best = antecedent
+                    best_weight = weight
+                    best_position = position
+                positive.append(antecedent)
+
+        if best is not None:
+            if graph:
+                return best
+            else:
+                return positive
+
+    @staticmethod
+    def compute_antecedent_from_weights(mention, multigraph, graph):
+        """ Compute the antecedent of a mention from the candidate weights of
+        a graph which does not store its edges.
+        Makes the same decision as compute_antecedent does on the edges of
+        a graph.
+        """
+        antecedents, weights = multigraph.get_candidate_weights(mention)
+        positive = weights > 0
+
+        if positive.any():
             if graph:
-                return sorted(weights)[-1][1]
+                best_weight = weights[positive].max()
+                return multigraph.nodes[
+                    antecedents[positive & (weights == best_weight)].max()]
             else:
-                pos_weights = [w[1] for w in weights if w[0] > 0]
-                if len(pos_weights) > 0:
-                    return pos_weights
\ No newline at end of file
+                return [multigraph.nodes[j] for j in antecedents[positive]]
+
+
+# the decoder of a worker process of the pool of decode_documents, set by
+# _init_worker and used by _decode_payload
+_worker_decoder = None
+
+
+def _init_worker(decoder):
+    global _worker_decoder
+    _worker_decoder = decoder
+
+
+def _to_payload(doc):
+    # the dummy mention is not part of the payload
+    spans = np.array([(mention.span.begin, mention.span.end)
+                      for mention in doc.system_mentions[1:]],
+                     dtype=np.int64).reshape(-1, 2)
+    return doc.to_payload(), spans
+
+
+def _decode_payload(payload):
+    document_payload, spans = payload
+    doc = Document.from_payload(document_payload,
+                                with_annotated_mentions=False)
+    doc.system_mentions = [Mention.dummy_from_document(doc)] + \
+        [Mention.from_document(Span(begin, end), doc)
+         for begin, end in spans.tolist()]
+
+    candidates = _worker_decoder.coref_multigraph_creator.candidates
+    num_candidates = candidates.num_candidates
+    num_pruned = candidates.num_pruned
+
+    _worker_decoder.decode([doc])
+
+    decisions = [((anaphor.begin, anaphor.end),
+                  (antecedent.begin, antecedent.end))
+                 for anaphor, antecedent in doc.antecedent_decisions.items()]
+
+    return ([mention.set_id for mention in doc.system_mentions[1:]],
+            decisions,
+            candidates.num_candidates - num_candidates,
+            candidates.num_pruned - num_pruned)
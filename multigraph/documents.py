@@ -1,6 +1,9 @@
 from multigraph.spans import Span
-from multigraph import mentions
+from multigraph import features, mentions
 from collections import defaultdict
+import io
+
+import numpy as np
 
 class Document(object):
     """Represents a document.
@@ -18,6 +21,30 @@ class Document(object):
             represented as lists of tokens with label information and pointers
             to heads. One list for each sentence.
         speakers (list(str)): All speaker ids,
+        vocabulary (list(str)): All distinct glosses, in order of first
+            occurrence.
+        gloss_ids (np.ndarray): Index into vocabulary of every token.
+        normalized_gloss_ids (np.ndarray): Normalized id of every gloss of
+            the vocabulary (see features.GlossVocabulary).
+        gloss_classes (np.ndarray): Gloss class of every gloss of the
+            vocabulary (see features.gloss_class).
+        noun_like_glosses (np.ndarray): Whether every gloss of the
+            vocabulary is noun-like (see features.is_noun_like).
+        signers (list(str)): All distinct speaker ids, in order of first
+            occurrence.
+        signer_ids (np.ndarray): Index into signers of every token.
+        sentence_ids (np.ndarray): Sentence index of every token.
+        mcp (np.ndarray): n x 2 finger MCP coordinates of every token.
+        tip (np.ndarray): n x 2 finger tip coordinates of every token.
+        start_times (np.ndarray): Start timestamp of every token (-1 if
+            unknown).
+        end_times (np.ndarray): End timestamp of every token (-1 if
+            unknown).
+        entity_ids (np.ndarray): Annotated entity of every token (-1 if the
+            token is not an annotated mention).
+        signer_class_index (dict((int, int), np.ndarray)): Positions of the
+            tokens of every signer and gloss class, see
+            get_signer_class_index (None until first computed).
         coref (dict(span, int)): A mapping of mention spans to their
             coreference set id.
         annotated_mentions list(Mention): All annotated mentions.
@@ -42,7 +69,8 @@ class Document(object):
                   in the sentence represented as lists of tokens with label
                   information and pointers to heads.
             coref (dict(span, int)): A mapping of mention spans to their
-            coreference set id.
+            coreference set id. Defaults to the annotated entities of the
+            glosses.
         """
         self.identifier = identifier
 
@@ -50,9 +78,16 @@ class Document(object):
         self.sentence_spans = []
         self.tokens = []
         self.speakers = data['participant']
-        self.mcp = []
-        self.tip = []
-    
+
+        vocabulary = {}
+        gloss_ids = []
+        sentence_ids = []
+        mcp = []
+        tip = []
+        start_times = []
+        end_times = []
+        entity_ids = []
+
         for sent_id, sent in enumerate(data['glosses']):
             offset = len(self.tokens)
             self.in_sentence_ids += list(range(0, len(sent)))
@@ -60,15 +95,120 @@ class Document(object):
                 offset, offset + len(sent) - 1
             ))
             for gloss_id, gloss in enumerate(sent):
-                self.tokens.append(gloss['Lexeme_Sign'])
-                self.mcp.append(gloss['FINGER_MCP'])
-                self.tip.append(gloss['FINGER_TIP'])
+                token = gloss['Lexeme_Sign']
+                if token not in vocabulary:
+                    vocabulary[token] = len(vocabulary)
+                self.tokens.append(token)
+                gloss_ids.append(vocabulary[token])
+                sentence_ids.append(sent_id)
+                mcp.append(gloss['FINGER_MCP'])
+                tip.append(gloss['FINGER_TIP'])
+                start_times.append(gloss.get('start', -1))
+                end_times.append(gloss.get('end', -1))
+                entity_ids.append(gloss.get('entity', -1))
+
+        signers = {}
+        for speaker in self.speakers:
+            if speaker not in signers:
+                signers[speaker] = len(signers)
+
+        self.vocabulary = list(vocabulary)
+        self.gloss_ids = np.array(gloss_ids, dtype=np.int32)
+        self.normalized_gloss_ids, self.gloss_classes, \
+            self.noun_like_glosses = features.GLOSSES.lookup_all(
+                self.vocabulary)
+        self.signers = list(signers)
+        self.signer_ids = np.array([signers[speaker]
+                                    for speaker in self.speakers],
+                                   dtype=np.int32)
+        self.sentence_ids = np.array(sentence_ids, dtype=np.int32)
+        # float64 keeps distances identical to the ones computed on the
+        # coordinates as read from json
+        self.mcp = np.array(mcp, dtype=np.float64).reshape(-1, 2)
+        self.tip = np.array(tip, dtype=np.float64).reshape(-1, 2)
+        self.start_times = np.array(start_times, dtype=np.int64)
+        self.end_times = np.array(end_times, dtype=np.int64)
+        self.entity_ids = np.array(entity_ids, dtype=np.int64)
 
         self.system_mentions = []
         self.spans = [Span(i, i) for i in range(len(self.tokens))]
-        self.coref = coref if coref is not None else {span:i for i,span in enumerate(self.spans)}
+        self.signer_class_index = None
+        self.coref = coref if coref is not None else self.__get_annotated_coref()
         self.annotated_mentions = self.__get_annotated_mentions()
-    
+
+    # columns a document can be rebuilt from, see to_payload
+    PAYLOAD_ARRAYS = ("gloss_ids", "signer_ids", "sentence_ids", "mcp", "tip",
+                      "start_times", "end_times", "entity_ids")
+
+    def __get_annotated_coref(self):
+        return {self.spans[i]: entity
+                for i, entity in enumerate(self.entity_ids.tolist())
+                if entity != -1}
+
+    def to_payload(self):
+        """ Get a compact representation of the document's columns.
+        The payload consists of numpy arrays and lists of strings only, so it
+        is cheap to pickle, for example to send it to another process.
+        Annotated and system mentions are not included.
+        Returns:
+            dict(str, object): The payload, see from_payload.
+        """
+        payload = {name: getattr(self, name)
+                   for name in Document.PAYLOAD_ARRAYS}
+        payload["identifier"] = self.identifier
+        payload["vocabulary"] = self.vocabulary
+        payload["gloss_codes"] = (self.normalized_gloss_ids,
+                                  self.gloss_classes, self.noun_like_glosses)
+        payload["signers"] = self.signers
+        payload["sentence_bounds"] = np.array(
+            [(span.begin, span.end) for span in self.sentence_spans],
+            dtype=np.int64).reshape(-1, 2)
+        return payload
+
+    @staticmethod
+    def from_payload(payload, with_annotated_mentions=True):
+        """ Rebuild a document from the payload created by to_payload.
+        Args:
+            payload (dict(str, object)): The payload.
+            with_annotated_mentions (bool): Whether to compute the annotated
+                mentions, which are not needed for decoding.
+        Returns:
+            Document: The document, without system mentions.
+        """
+        document = Document.__new__(Document)
+        document.identifier = payload["identifier"]
+        for name in Document.PAYLOAD_ARRAYS:
+            setattr(document, name, payload[name])
+        document.vocabulary = payload["vocabulary"]
+        document.signers = payload["signers"]
+        if "gloss_codes" in payload:
+            codes = payload["gloss_codes"]
+        else:
+            codes = features.GLOSSES.lookup_all(document.vocabulary)
+        document.normalized_gloss_ids, document.gloss_classes, \
+            document.noun_like_glosses = codes
+
+        document.tokens = [document.vocabulary[i]
+                           for i in document.gloss_ids.tolist()]
+        document.speakers = [document.signers[i]
+                             for i in document.signer_ids.tolist()]
+        document.sentence_spans = [Span(begin, end) for begin, end
+                                   in payload["sentence_bounds"].tolist()]
+        document.in_sentence_ids = []
+        for span in document.sentence_spans:
+            document.in_sentence_ids += list(range(0, span.end - span.begin + 1))
+
+        document.system_mentions = []
+        document.spans = [Span(i, i) for i in range(len(document.tokens))]
+        document.signer_class_index = None
+        document.coref = document.__get_annotated_coref()
+        document.annotated_mentions = []
+        if with_annotated_mentions:
+            document.annotated_mentions = \
+                document.__get_annotated_mentions()
+
+        return document
+
     def __get_annotated_mentions(self):
         mention_spans = sorted(list(self.coref.keys()))
 
@@ -135,7 +275,7 @@ class Document(object):
 
         for mention in self.system_mentions:
             if not mention.is_dummy():
-                ante = mention.attributes["antecedent"]
+                ante = mention.antecedent
 
                 if ante:
                     file.write(self.identifier + "\t" +
@@ -163,18 +303,17 @@ class Document(object):
                 spans_to_annotated_mentions[span_antecedent] = \
                     mentions.Mention.from_document(span_antecedent, self)
                 spans_to_annotated_mentions[
-                    span_antecedent].attributes["annotated_set_id"] = set_id
+                    span_antecedent].annotated_set_id = set_id
                 set_id += 1
             if span_anaphor not in spans_to_annotated_mentions:
                 spans_to_annotated_mentions[span_anaphor] = \
                     mentions.Mention.from_document(span_anaphor, self)
-                spans_to_annotated_mentions[span_anaphor].attributes[
-                    "annotated_set_id"] = spans_to_annotated_mentions[
-                        span_antecedent].attributes["annotated_set_id"]
+                spans_to_annotated_mentions[span_anaphor].annotated_set_id = \
+                    spans_to_annotated_mentions[
+                        span_antecedent].annotated_set_id
 
-            spans_to_annotated_mentions[span_anaphor].attributes[
-                "antecedent"] = spans_to_annotated_mentions[
-                    span_antecedent]
+            spans_to_annotated_mentions[span_anaphor].antecedent = \
+                spans_to_annotated_mentions[span_antecedent]
 
             self.annotated_mentions = sorted(
                 list(spans_to_annotated_mentions.values()))
@@ -183,7 +322,7 @@ class Document(object):
 
             for span in spans_to_annotated_mentions:
                 self.coref[span] = spans_to_annotated_mentions[
-                    span].attributes["annotated_set_id"]
+                    span].annotated_set_id
 
     def get_antecedent_decisions(self, which_mentions="annotated"):
         """ Get all antecedent decisions in this document.
@@ -204,13 +343,38 @@ class Document(object):
             doc_mentions = self.system_mentions
 
         for mention in doc_mentions:
-            antecedent = mention.attributes["antecedent"]
+            antecedent = mention.antecedent
 
             if antecedent:
                 antecedent_decisions[mention] = antecedent
 
         return antecedent_decisions
 
+    def get_signer_class_index(self):
+        """ Get the positions of the tokens of every signer and gloss class
+        (see features.gloss_class). The index is computed on first use.
+        Returns:
+            dict((int, int), np.ndarray): The sorted positions of the tokens
+            of every (signer id, gloss class) which occurs.
+        """
+        if self.signer_class_index is None:
+            self.signer_class_index = features.signer_class_index(
+                self.signer_ids, self.gloss_classes[self.gloss_ids])
+        return self.signer_class_index
+
+    def get_gloss_codes(self, position):
+        """ Get the codes of the gloss at a position.
+        Args:
+            position (int): The position of a token.
+        Returns:
+            (int, int, bool): The normalized id, the gloss class and whether
+            the gloss is noun-like, see features.GlossVocabulary.
+        """
+        gloss_id = self.gloss_ids[position]
+        return (int(self.normalized_gloss_ids[gloss_id]),
+                int(self.gloss_classes[gloss_id]),
+                bool(self.noun_like_glosses[gloss_id]))
+
     def get_sentence_id_and_span(self, span):
         """ Get the sentence span from the sentence embedding the span.
         Args:
@@ -219,10 +383,35 @@ class Document(object):
             Span: The span of the sentence which embeds the text corresponding
             to the span.
         """
-        for i, sentence_span in enumerate(self.sentence_spans):
-            if sentence_span.embeds(span):
+        if 0 <= span.begin < len(self.sentence_ids):
+            i = int(self.sentence_ids[span.begin])
+            sentence_span = self.sentence_spans[i]
+            if span.end <= sentence_span.end:
                 return i, sentence_span
 
+    def get_sentence_ids(self, spans):
+        """ Get the ids of the sentences embedding many spans at once.
+        Args:
+            spans (list(Span)): Spans corresponding to fragments of the
+                document.
+        Returns:
+            np.ndarray: The id of the sentence embedding each span, or -1 if
+            no sentence embeds it.
+        """
+        begins = np.array([span.begin for span in spans], dtype=np.int64)
+        ends = np.array([span.end for span in spans], dtype=np.int64)
+
+        sentence_ends = np.array([span.end for span in self.sentence_spans],
+                                 dtype=np.int64)
+
+        valid = (begins >= 0) & (begins < len(self.sentence_ids))
+        ids = np.full(len(spans), -1, dtype=np.int64)
+        ids[valid] = self.sentence_ids[begins[valid]]
+        valid[valid] = ends[valid] <= sentence_ends[ids[valid]]
+        ids[~valid] = -1
+
+        return ids
+
     def to_simple_output(self):
         """ Convert the document into a simple textual representation,
         containing tokens and coreference information.
@@ -240,46 +429,124 @@ class Document(object):
         Returns:
             (str): A textual representation of document as described above.
         """
-        content = []
+        output = io.StringIO()
+        self.write_simple_output(output)
+        return output.getvalue()
 
-        for sentence_span in self.sentence_spans:
-            content += self.tokens[sentence_span.begin:
-                                   sentence_span.end+1]
+    def write_simple_output(self, file):
+        """ Write the representation of to_simple_output to a file, one
+        sentence at a time.
+        Args:
+            file (file): The file the document should be written to.
+        """
+        # tags of mentions beginning at a token, innermost (first) last
+        opening_tags = defaultdict(list)
+        closing_tags = defaultdict(int)
 
         mention_to_id = {}
+        identifier = str(self.identifier)
 
         for i, mention in enumerate(self.system_mentions[1:]):
             mention_to_id[mention] = i
 
-            tag_begin = "<mention id=\"" + str(i) + "\" " \
-                        "document_id=\"" + str(mention.document.identifier) + "\" " \
-                        "span_start=\"" + str(mention.span.begin) + "\" " \
-                        "span_end=\"" + str(mention.span.end) + "\""
-
-            if mention.attributes["set_id"]:
-                tag_begin += " entity=\"" + \
-                             str(mention.attributes["set_id"]) + "\""
+            tag = ["<mention id=\"", str(i),
+                   "\" document_id=\"", identifier,
+                   "\" span_start=\"", str(mention.span.begin),
+                   "\" span_end=\"", str(mention.span.end), "\""]
 
-            if mention.attributes["antecedent"]:
-                antecedent_id = mention_to_id[
-                    mention.attributes["antecedent"]]
+            if mention.set_id:
+                tag += [" entity=\"", str(mention.set_id), "\""]
 
-                tag_begin += " antecedent=\"" + str(antecedent_id) + "\""
+            if mention.antecedent:
+                antecedent_id = mention_to_id[mention.antecedent]
 
-            tag_begin += ">"
+                tag += [" antecedent=\"", str(antecedent_id), "\""]
 
-            old_begin = content[mention.span.begin]
-            content[mention.span.begin] = tag_begin + old_begin
+            tag.append(">")
 
-            content[mention.span.end] += "</mention>"
-
-        output_string = ""
+            opening_tags[mention.span.begin].append("".join(tag))
+            closing_tags[mention.span.end] += 1
 
         for sentence_span in self.sentence_spans:
-            output_string += " ".join(
-                content[sentence_span.begin:sentence_span.end+1]) + "\n"
-
-        return output_string
+            content = self.tokens[sentence_span.begin:sentence_span.end+1]
+
+            for i in range(sentence_span.begin, sentence_span.end + 1):
+                if i in opening_tags or i in closing_tags:
+                    content[i - sentence_span.begin] = \
+                        "".join(reversed(opening_tags.get(i, ()))) + \
+                        content[i - sentence_span.begin] + \
+                        "</mention>" * closing_tags.get(i, 0)
+
+            file.write(" ".join(content) + "\n")
+
+    def to_conll_key(self, index):
+        """ Convert the annotated coreference of the document into the CoNLL
+        key format read by scorer.pl, as written by ``format_conll.py
+        --key``.
+        Each token is written on one line as
+        ``test<sentence>  <index>  <token in sentence>  <token>  <entity>``,
+        where entity is ``(<id>)`` for annotated mentions (with entities
+        renumbered by first occurrence in the document) and ``-`` otherwise.
+        Args:
+            index (int): The position of the document in the output file.
+        Returns:
+            (str): The CoNLL representation of the key.
+        """
+        lines = ["#begin document (" + str(self.identifier) + "); \n"]
+        entity_map = {}
+
+        for sent_id, sentence_span in enumerate(self.sentence_spans):
+            for i in range(sentence_span.begin, sentence_span.end + 1):
+                entity = self.coref.get(self.spans[i])
+                if entity is not None:
+                    entity = "(" + str(entity_map.setdefault(
+                        entity, len(entity_map))) + ")"
+                else:
+                    entity = "-"
+                lines.append("test" + str(sent_id + 1) + "\t" + str(index) +
+                             "\t" + str(i - sentence_span.begin) + "\t" +
+                             self.tokens[i] + "\t" + entity + "\n")
+            lines.append("\n")
+
+        lines.append("#end document\n")
+        return "".join(lines)
+
+    def to_conll_response(self, index):
+        """ Convert the coreference decisions of the document into the CoNLL
+        response format read by scorer.pl.
+        The output is the one ``format_conll.py`` produces from
+        to_simple_output: every system mention is written on one line,
+        grouped by the sentence it starts in, with its set id (if any)
+        renumbered by first occurrence in the document.
+        Args:
+            index (int): The position of the document in the output file.
+        Returns:
+            (str): The CoNLL representation of the response.
+        """
+        by_sentence = [[] for _ in self.sentence_spans]
+        for mention in self.system_mentions[1:]:
+            by_sentence[self.sentence_ids[mention.span.begin]].append(mention)
+
+        lines = ["#begin document (" + str(self.identifier) + "); \n"]
+        entity_map = {}
+
+        for sent_id, sentence_mentions in enumerate(by_sentence):
+            sentence_mentions.sort(key=lambda mention: mention.span.begin)
+            for gloss_id, mention in enumerate(sentence_mentions):
+                text = " ".join(
+                    self.tokens[mention.span.begin:mention.span.end + 1])
+                if mention.set_id:
+                    entity = "(" + str(entity_map.setdefault(
+                        mention.set_id, len(entity_map))) + ")"
+                else:
+                    entity = "-"
+                lines.append("test" + str(sent_id + 1) + "\t" + str(index) +
+                             "\t" + str(gloss_id) + "\t" + text + "\t" +
+                             entity + "\n")
+            lines.append("\n")
+
+        lines.append("#end document\n")
+        return "".join(lines)
 
     def get_string_representation(self):
         """ Get a string representation of the document.
@@ -326,7 +593,7 @@ class Document(object):
         index_to_strings = defaultdict(list)
 
         for mention in mentions_in_doc:
-            set_id = mention.attributes["set_id"]
+            set_id = mention.set_id
 
             if set_id is None:
                 continue
@@ -556,7 +823,7 @@ class CoNLLDocument(Document):
         index_to_strings = defaultdict(list)
 
         for mention in mentions_in_doc:
-            set_id = mention.attributes["set_id"]
+            set_id = mention.set_id
 
             if set_id is None:
                 continue
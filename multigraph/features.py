@@ -14,60 +14,137 @@ def dist(loc1, loc2):
     x,y = loc2
     return np.sqrt((a-x)**2 + (b-y)**2)
 
+# Gloss classes
+
+OTHER_CLASS = 0
+I_CLASS = 1
+YOU_CLASS = 2
+INDEX_CLASS = 3
+NUM_CLASSES = 4
+
+PERSON_CLASSES = (I_CLASS, YOU_CLASS)
+
+_I_SIGNS = frozenset(I_SIGNS)
+_YOU_SIGNS = frozenset(YOU_SIGNS)
+_INDEX_SIGNS = frozenset(INDEX_SIGNS)
+
+
+def gloss_class(gloss):
+    gloss = normalize(gloss)
+    if gloss in _I_SIGNS:
+        return I_CLASS
+    elif gloss in _YOU_SIGNS:
+        return YOU_CLASS
+    elif gloss in _INDEX_SIGNS:
+        return INDEX_CLASS
+    return OTHER_CLASS
+
+
+def is_noun_like(gloss):
+    gloss = normalize(gloss)
+    return not gloss.startswith("TO-") and not gloss.startswith("GEST-") and gloss not in _INDEX_SIGNS
+
+
+class GlossVocabulary:
+    """ Normalizes and classifies every distinct gloss once.
+    Attributes:
+        normalized (list(str)): All distinct normalized glosses, indexed by
+            their normalized id.
+    """
+    def __init__(self):
+        self.normalized = []
+        self.__normalized_ids = {}
+        self.__codes = {}
+
+    def lookup(self, gloss):
+        """ Get the codes of a gloss.
+        Args:
+            gloss (str): A gloss, as annotated.
+        Returns:
+            (int, int, bool): The normalized id, the gloss class and whether
+            the gloss is noun-like (see is_noun_like).
+        """
+        codes = self.__codes.get(gloss)
+        if codes is None:
+            normalized = normalize(gloss)
+            if normalized not in self.__normalized_ids:
+                self.__normalized_ids[normalized] = len(self.normalized)
+                self.normalized.append(normalized)
+            codes = (self.__normalized_ids[normalized], gloss_class(gloss),
+                     is_noun_like(gloss))
+            self.__codes[gloss] = codes
+        return codes
+
+    def lookup_all(self, glosses):
+        """ Get the codes of many glosses, see lookup.
+        Args:
+            glosses (list(str)): Glosses, as annotated.
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): The normalized ids, gloss
+            classes and noun-like flags of the glosses.
+        """
+        codes = [self.lookup(gloss) for gloss in glosses]
+        return (np.array([c[0] for c in codes], dtype=np.int32),
+                np.array([c[1] for c in codes], dtype=np.int8),
+                np.array([c[2] for c in codes], dtype=bool))
+
+
+# the vocabulary shared by all documents of a process
+GLOSSES = GlossVocabulary()
+
+
 # Multigraph features
+#
+# The features read the gloss class and noun-like flag of the first gloss of
+# each mention, see Mention.gloss_class and Mention.noun_like.
 
 def me_or_you(anaphor, antecedent):
 
-    anaphor_gloss = normalize(anaphor.attributes["tokens"][0])
-    anaphor_signer = anaphor.attributes["speaker"][0]
-    antecedent_gloss = normalize(antecedent.attributes["tokens"][0])
-    antecedent_signer = antecedent.attributes["speaker"][0]
+    anaphor_class = anaphor.gloss_class
+    antecedent_class = antecedent.gloss_class
 
-    if anaphor_signer == antecedent_signer:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in YOU_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in I_SIGNS):
+    if anaphor.signer_ids[0] == antecedent.signer_ids[0]:
+        if (anaphor_class == YOU_CLASS and antecedent_class == YOU_CLASS) or (anaphor_class == I_CLASS and antecedent_class == I_CLASS):
             return 0.5
     else:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in I_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in YOU_SIGNS):
+        if (anaphor_class == YOU_CLASS and antecedent_class == I_CLASS) or (anaphor_class == I_CLASS and antecedent_class == YOU_CLASS):
             return 0.5
     return 0
 
 def not_me_or_you(anaphor, antecedent):
 
-    anaphor_gloss = normalize(anaphor.attributes["tokens"][0])
-    anaphor_signer = anaphor.attributes["speaker"][0]
-    antecedent_gloss = normalize(antecedent.attributes["tokens"][0])
-    antecedent_signer = antecedent.attributes["speaker"][0]
+    anaphor_class = anaphor.gloss_class
+    antecedent_class = antecedent.gloss_class
 
-    if anaphor_signer == antecedent_signer:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in I_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in YOU_SIGNS):
+    if anaphor.signer_ids[0] == antecedent.signer_ids[0]:
+        if (anaphor_class == YOU_CLASS and antecedent_class == I_CLASS) or (anaphor_class == I_CLASS and antecedent_class == YOU_CLASS):
             return -np.inf
     else:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in YOU_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in I_SIGNS):
+        if (anaphor_class == YOU_CLASS and antecedent_class == YOU_CLASS) or (anaphor_class == I_CLASS and antecedent_class == I_CLASS):
             return -np.inf
     return 0
 
 def spatially_close(anaphor, antecedent):
-    if (anaphor.span.begin - antecedent.span.end) < 100 and anaphor.attributes["speaker"][0] == antecedent.attributes["speaker"][0] and normalize(anaphor.attributes["tokens"][0]) in INDEX_SIGNS and normalize(antecedent.attributes["tokens"][0]) in INDEX_SIGNS:
-        distance = min(dist(anaphor.attributes["mcp"][0], antecedent.attributes["mcp"][0]), dist(anaphor.attributes["tip"][0], antecedent.attributes["tip"][0]))
+    if (anaphor.span.begin - antecedent.span.end) < 100 and anaphor.signer_ids[0] == antecedent.signer_ids[0] and anaphor.gloss_class == INDEX_CLASS and antecedent.gloss_class == INDEX_CLASS:
+        distance = min(dist(anaphor.mcp[0], antecedent.mcp[0]), dist(anaphor.tip[0], antecedent.tip[0]))
         return max(0, 0.5 + (50 - distance) / 50)
     return 0
 
 def prev_ante_is_noun(anaphor, antecedent):
-    antecedent_gloss = normalize(antecedent.attributes["tokens"][0])
-    if anaphor.attributes["speaker"][0] == antecedent.attributes["speaker"][0] and antecedent.span.end == anaphor.span.begin - 1 and normalize(anaphor.attributes["tokens"][0]) in INDEX_SIGNS and not antecedent_gloss.startswith("TO-") and not antecedent_gloss.startswith("GEST-") and antecedent_gloss not in INDEX_SIGNS: 
+    if anaphor.signer_ids[0] == antecedent.signer_ids[0] and antecedent.span.end == anaphor.span.begin - 1 and anaphor.gloss_class == INDEX_CLASS and antecedent.noun_like:
         return 0.5
     return 0
     
 def third_person(anaphor, antecedent):
-    anaphor_gloss = normalize(anaphor.attributes["tokens"][0])
-    antecedent_gloss = normalize(antecedent.attributes["tokens"][0])
-    if (anaphor_gloss in INDEX_SIGNS and antecedent_gloss in I_SIGNS + YOU_SIGNS) or (antecedent_gloss in INDEX_SIGNS and anaphor_gloss in I_SIGNS + YOU_SIGNS):
+    anaphor_class = anaphor.gloss_class
+    antecedent_class = antecedent.gloss_class
+    if (anaphor_class == INDEX_CLASS and antecedent_class in PERSON_CLASSES) or (antecedent_class == INDEX_CLASS and anaphor_class in PERSON_CLASSES):
         return -np.inf
     return 0
 
 def spatially_far(anaphor, antecedent):
-    if normalize(anaphor.attributes["tokens"][0]) in INDEX_SIGNS and normalize(antecedent.attributes["tokens"][0]) in INDEX_SIGNS:
-        distance = min(dist(anaphor.attributes["mcp"][0], antecedent.attributes["mcp"][0]), dist(anaphor.attributes["tip"][0], antecedent.attributes["tip"][0]))
+    if anaphor.gloss_class == INDEX_CLASS and antecedent.gloss_class == INDEX_CLASS:
+        distance = min(dist(anaphor.mcp[0], antecedent.mcp[0]), dist(anaphor.tip[0], antecedent.tip[0]))
         if distance > 100:
             return -np.inf
     return 0
@@ -77,21 +154,283 @@ def spatially_far(anaphor, antecedent):
 
 def base_me_or_you(anaphor, antecedent):
 
-    anaphor_gloss = normalize(anaphor.attributes["tokens"][0])
-    anaphor_signer = anaphor.attributes["speaker"][0]
-    antecedent_gloss = normalize(antecedent.attributes["tokens"][0])
-    antecedent_signer = antecedent.attributes["speaker"][0]
+    anaphor_class = anaphor.gloss_class
+    antecedent_class = antecedent.gloss_class
 
-    if anaphor_signer == antecedent_signer:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in YOU_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in I_SIGNS):
+    if anaphor.signer_ids[0] == antecedent.signer_ids[0]:
+        if (anaphor_class == YOU_CLASS and antecedent_class == YOU_CLASS) or (anaphor_class == I_CLASS and antecedent_class == I_CLASS):
             return np.inf
     else:
-        if (anaphor_gloss in YOU_SIGNS and antecedent_gloss in I_SIGNS) or (anaphor_gloss in I_SIGNS and antecedent_gloss in YOU_SIGNS):
+        if (anaphor_class == YOU_CLASS and antecedent_class == I_CLASS) or (anaphor_class == I_CLASS and antecedent_class == YOU_CLASS):
             return np.inf
     return 0
 
 def temporally_close(anaphor, antecedent):
-    if (anaphor.span.begin - antecedent.span.end) < 100 and anaphor.attributes["speaker"][0] == antecedent.attributes["speaker"][0] and normalize(antecedent.attributes["tokens"][0]) in INDEX_SIGNS and normalize(anaphor.attributes["tokens"][0]) in INDEX_SIGNS:
+    if (anaphor.span.begin - antecedent.span.end) < 100 and anaphor.signer_ids[0] == antecedent.signer_ids[0] and antecedent.gloss_class == INDEX_CLASS and anaphor.gloss_class == INDEX_CLASS:
         return np.inf
     return 0
 
+
+# Batch features
+#
+# Each batch feature computes the value of its pairwise counterpart for many
+# pairs of mentions of a document at once. The pairs are given as two index
+# arrays of broadcastable shape, entry k of the result equals
+# feature(mentions[anaphors[k]], mentions[antecedents[k]]).
+
+
+def signer_class_index(signer, gloss_class):
+    """ Group positions by signer and gloss class.
+    Args:
+        signer (np.ndarray): The signer id at every position.
+        gloss_class (np.ndarray): The gloss class at every position.
+    Returns:
+        dict((int, int), np.ndarray): The sorted positions of every
+        (signer id, gloss class) which occurs.
+    """
+    keys = signer.astype(np.int64) * NUM_CLASSES + gloss_class
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    return {(int(key) // NUM_CLASSES, int(key) % NUM_CLASSES): positions
+            for key, positions in zip(unique_keys.tolist(),
+                                      np.split(order, starts[1:]))}
+
+
+class MentionArrays:
+    """ Per-mention arrays of the attributes read by the features.
+    Attributes:
+        gloss_class (np.ndarray): Class code of the first gloss of each
+            mention (one of OTHER_CLASS, I_CLASS, YOU_CLASS, INDEX_CLASS).
+        noun_like (np.ndarray): Whether the first gloss of each mention may
+            be the noun an INDEX sign points back to.
+        signer (np.ndarray): Interned id of the signer of each mention.
+        begin (np.ndarray): Begin of the span of each mention.
+        end (np.ndarray): End of the span of each mention.
+        start_time (np.ndarray): Start timestamp of each mention.
+        end_time (np.ndarray): End timestamp of each mention.
+        mcp (np.ndarray): n x 2 finger MCP coordinates.
+        tip (np.ndarray): n x 2 finger tip coordinates.
+    """
+    def __init__(self, mentions):
+        """ Collect the arrays from a list of (non-dummy) mentions.
+        The values are gathered from the columns of the mentions' document
+        at the first token of every mention.
+        Args:
+            mentions (list(Mention)): The mentions of a document.
+        """
+        self.document = mentions[0].document if mentions else None
+        self.begin = np.array([mention.span.begin for mention in mentions],
+                              dtype=np.int64)
+        self.end = np.array([mention.span.end for mention in mentions],
+                            dtype=np.int64)
+
+        if len(mentions) == 0:
+            self.gloss_class = np.zeros(0, dtype=np.int8)
+            self.noun_like = np.zeros(0, dtype=bool)
+            self.signer = np.zeros(0, dtype=np.int32)
+            self.start_time = np.zeros(0, dtype=np.int64)
+            self.end_time = np.zeros(0, dtype=np.int64)
+            self.mcp = np.zeros((0, 2), dtype=np.float64)
+            self.tip = np.zeros((0, 2), dtype=np.float64)
+            return
+
+        document = mentions[0].document
+        gloss_ids = document.gloss_ids[self.begin]
+
+        self.gloss_class = document.gloss_classes[gloss_ids]
+        self.noun_like = document.noun_like_glosses[gloss_ids]
+        self.signer = document.signer_ids[self.begin]
+        self.start_time = document.start_times[self.begin]
+        self.end_time = document.end_times[self.end]
+        self.mcp = document.mcp[self.begin]
+        self.tip = document.tip[self.begin]
+
+    def __len__(self):
+        return len(self.begin)
+
+    def get_signer_class_index(self):
+        """ Get the positions of the mentions of every signer and gloss
+        class, see signer_class_index. If the mentions are the tokens of
+        their document, the index of the document is used.
+        Returns:
+            dict((int, int), np.ndarray): The sorted mention positions of
+            every (signer id, gloss class) which occurs.
+        """
+        if self.document is not None and \
+                len(self.begin) == len(self.document.tokens) and \
+                np.array_equal(self.begin, np.arange(len(self.begin))) and \
+                np.array_equal(self.end, self.begin):
+            return self.document.get_signer_class_index()
+        return signer_class_index(self.signer, self.gloss_class)
+
+
+def _batch_dist(locs, anaphors, antecedents):
+    a, b = locs[anaphors, 0], locs[anaphors, 1]
+    x, y = locs[antecedents, 0], locs[antecedents, 1]
+    return np.sqrt((a-x)**2 + (b-y)**2)
+
+
+def _batch_distance(arrays, anaphors, antecedents):
+    return np.minimum(_batch_dist(arrays.mcp, anaphors, antecedents),
+                      _batch_dist(arrays.tip, anaphors, antecedents))
+
+
+def _batch_same_signer(arrays, anaphors, antecedents):
+    return arrays.signer[anaphors] == arrays.signer[antecedents]
+
+
+def _batch_person_agreement(arrays, anaphors, antecedents):
+    """ Return masks for "same person" and "swapped person" I/YOU pairs. """
+    anaphor_class = arrays.gloss_class[anaphors]
+    antecedent_class = arrays.gloss_class[antecedents]
+    same_person = ((anaphor_class == YOU_CLASS) & (antecedent_class == YOU_CLASS)) | \
+                  ((anaphor_class == I_CLASS) & (antecedent_class == I_CLASS))
+    swapped_person = ((anaphor_class == YOU_CLASS) & (antecedent_class == I_CLASS)) | \
+                     ((anaphor_class == I_CLASS) & (antecedent_class == YOU_CLASS))
+    return same_person, swapped_person
+
+
+def _batch_both_index(arrays, anaphors, antecedents):
+    return (arrays.gloss_class[anaphors] == INDEX_CLASS) & \
+        (arrays.gloss_class[antecedents] == INDEX_CLASS)
+
+
+def _batch_close_index(arrays, anaphors, antecedents):
+    return ((arrays.begin[anaphors] - arrays.end[antecedents]) < 100) & \
+        _batch_same_signer(arrays, anaphors, antecedents) & \
+        _batch_both_index(arrays, anaphors, antecedents)
+
+
+def batch_me_or_you(arrays, anaphors, antecedents):
+    same_signer = _batch_same_signer(arrays, anaphors, antecedents)
+    same_person, swapped_person = _batch_person_agreement(arrays, anaphors, antecedents)
+    fires = np.where(same_signer, same_person, swapped_person)
+    return np.where(fires, 0.5, 0.0)
+
+
+def batch_not_me_or_you(arrays, anaphors, antecedents):
+    same_signer = _batch_same_signer(arrays, anaphors, antecedents)
+    same_person, swapped_person = _batch_person_agreement(arrays, anaphors, antecedents)
+    fires = np.where(same_signer, swapped_person, same_person)
+    return np.where(fires, -np.inf, 0.0)
+
+
+def batch_spatially_close(arrays, anaphors, antecedents):
+    fires = _batch_close_index(arrays, anaphors, antecedents)
+    distance = _batch_distance(arrays, anaphors, antecedents)
+    return np.where(fires, np.maximum(0, 0.5 + (50 - distance) / 50), 0.0)
+
+
+def batch_prev_ante_is_noun(arrays, anaphors, antecedents):
+    fires = _batch_same_signer(arrays, anaphors, antecedents) & \
+        (arrays.end[antecedents] == arrays.begin[anaphors] - 1) & \
+        (arrays.gloss_class[anaphors] == INDEX_CLASS) & \
+        arrays.noun_like[antecedents]
+    return np.where(fires, 0.5, 0.0)
+
+
+def batch_third_person(arrays, anaphors, antecedents):
+    anaphor_class = arrays.gloss_class[anaphors]
+    antecedent_class = arrays.gloss_class[antecedents]
+    anaphor_person = (anaphor_class == I_CLASS) | (anaphor_class == YOU_CLASS)
+    antecedent_person = (antecedent_class == I_CLASS) | (antecedent_class == YOU_CLASS)
+    fires = ((anaphor_class == INDEX_CLASS) & antecedent_person) | \
+        ((antecedent_class == INDEX_CLASS) & anaphor_person)
+    return np.where(fires, -np.inf, 0.0)
+
+
+def batch_spatially_far(arrays, anaphors, antecedents):
+    fires = _batch_both_index(arrays, anaphors, antecedents) & \
+        (_batch_distance(arrays, anaphors, antecedents) > 100)
+    return np.where(fires, -np.inf, 0.0)
+
+
+def batch_base_me_or_you(arrays, anaphors, antecedents):
+    same_signer = _batch_same_signer(arrays, anaphors, antecedents)
+    same_person, swapped_person = _batch_person_agreement(arrays, anaphors, antecedents)
+    fires = np.where(same_signer, same_person, swapped_person)
+    return np.where(fires, np.inf, 0.0)
+
+
+def batch_temporally_close(arrays, anaphors, antecedents):
+    return np.where(_batch_close_index(arrays, anaphors, antecedents),
+                    np.inf, 0.0)
+
+
+# maps pairwise features to their batch counterparts
+BATCH_FEATURES = {
+    me_or_you: batch_me_or_you,
+    not_me_or_you: batch_not_me_or_you,
+    spatially_close: batch_spatially_close,
+    prev_ante_is_noun: batch_prev_ante_is_noun,
+    third_person: batch_third_person,
+    spatially_far: batch_spatially_far,
+    base_me_or_you: batch_base_me_or_you,
+    temporally_close: batch_temporally_close,
+}
+
+
+# Positive support of the features
+#
+# For every feature, the combinations of anaphor gloss class, antecedent
+# gloss class, signer relation (SAME_SIGNER or OTHER_SIGNER), token window
+# and radius for which the feature can be positive, or ADJACENT if it can
+# only be positive for the mention immediately preceding the anaphor. The
+# token window bounds the distance between the begin of the anaphor and the
+# end of the antecedent, the radius bounds the smaller distance of their
+# finger MCP and finger tip coordinates, None means unbounded. A pair
+# outside the support of all features of a model has a weight of at most 0
+# and is never chosen as antecedent, so it does not need to be visited.
+
+SAME_SIGNER = 1
+OTHER_SIGNER = 2
+ADJACENT = "adjacent"
+
+# spatially_close is positive iff 0.5 + (50 - distance) / 50 > 0
+SPATIALLY_CLOSE_RADIUS = 75
+
+_PERSON_AGREEMENT = ((I_CLASS, I_CLASS, SAME_SIGNER, None, None),
+                     (YOU_CLASS, YOU_CLASS, SAME_SIGNER, None, None),
+                     (I_CLASS, YOU_CLASS, OTHER_SIGNER, None, None),
+                     (YOU_CLASS, I_CLASS, OTHER_SIGNER, None, None))
+
+POSITIVE_SUPPORT = {
+    me_or_you: _PERSON_AGREEMENT,
+    not_me_or_you: (),
+    spatially_close: ((INDEX_CLASS, INDEX_CLASS, SAME_SIGNER, 100,
+                       SPATIALLY_CLOSE_RADIUS),),
+    prev_ante_is_noun: ADJACENT,
+    third_person: (),
+    spatially_far: (),
+    base_me_or_you: _PERSON_AGREEMENT,
+    temporally_close: ((INDEX_CLASS, INDEX_CLASS, SAME_SIGNER, 100, None),),
+}
+
+
+# Models
+#
+# The features of every model and the graph argument of its decoder (see
+# MultigraphDecoder): True picks the best antecedent, False merges all
+# antecedents with a positive weight.
+
+MODELS = {
+    # "multigraph" with third_person and spatially_far is also supported
+    "multigraph": ([not_me_or_you, me_or_you, spatially_close,
+                    prev_ante_is_noun], True),
+    "baseline": ([base_me_or_you, temporally_close, prev_ante_is_noun],
+                 False),
+}
+
+
+def get_model(name):
+    """ Get the features of a model and how it is decoded.
+    Args:
+        name (str): The name of the model, a key of MODELS.
+    Returns:
+        (list(function), bool): A new list of the features of the model and
+        the graph argument of its decoder.
+    """
+    if name not in MODELS:
+        raise ValueError("Unknown model: " + name)
+    model_features, graph = MODELS[name]
+    return list(model_features), graph
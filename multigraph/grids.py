@@ -0,0 +1,74 @@
+""" Grid hashes over the hand positions of mentions."""
+
+import numpy as np
+
+
+class GridIndex:
+    """ A uniform grid over the points of some mentions, answering "which
+    of these mentions are within a radius of a point" by visiting the 3 x 3
+    cells around the point only.
+
+    Attributes:
+        cell_size (float): The side length of the cells, queries with a
+            radius of at most cell_size are exact.
+        cells (dict((int, int), np.ndarray)): The sorted positions of the
+            mentions in every non-empty cell.
+    """
+    def __init__(self, positions, points, cell_size):
+        """ Build the grid.
+        Args:
+            positions (np.ndarray): The sorted positions of the mentions.
+            points (np.ndarray): n x 2 coordinates of the mentions.
+            cell_size (float): The side length of the cells.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+
+        # points with nan coordinates are not within any distance
+        finite = np.isfinite(points).all(axis=1)
+        positions = positions[finite]
+        points = points[finite]
+
+        if len(positions) == 0:
+            return
+
+        coordinates = np.floor(points / cell_size).astype(np.int64)
+        # a stable sort keeps the positions of a cell sorted
+        order = np.lexsort((coordinates[:, 1], coordinates[:, 0]))
+        coordinates = coordinates[order]
+        starts = np.flatnonzero(np.any(
+            np.diff(coordinates, axis=0) != 0, axis=1)) + 1
+        for cell, cell_positions in zip(
+                coordinates[np.concatenate(([0], starts))].tolist(),
+                np.split(positions[order], starts)):
+            self.cells[tuple(cell)] = cell_positions
+
+    def query(self, point, begin, end):
+        """ Get the mentions which may be within cell_size of a point.
+        Args:
+            point (np.ndarray): The coordinates of the point.
+            begin (int): The smallest position to return.
+            end (int): The position after the largest position to return.
+        Returns:
+            np.ndarray: The positions in [begin, end) of the mentions in the
+            cells around the point (unsorted, the caller filters by
+            distance).
+        """
+        if not np.isfinite(point).all():
+            return np.zeros(0, dtype=np.int64)
+
+        x, y = np.floor(np.asarray(point) / self.cell_size).astype(
+            np.int64).tolist()
+
+        parts = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                positions = self.cells.get((x + dx, y + dy))
+                if positions is not None:
+                    parts.append(positions[
+                        np.searchsorted(positions, begin):
+                        np.searchsorted(positions, end)])
+
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(parts)
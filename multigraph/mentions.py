@@ -1,42 +1,130 @@
+from collections.abc import MutableMapping
+
 from multigraph.spans import Span
 
 __author__ = 'smartschat'
 
 class Mention:
     """ A mention is an expression in a document which is potentially referring.
+    The document and span of a mention are immutable, so mentions can be
+    hashed and compared cheaply. Linguistic information is read from the
+    document on access instead of being copied into the mention.
     Attributes:
         document (CoNLLDocument): The document the mention belongs to.
         span (Span): The span of the mention in its document. If for example
             the span is (3, 4), then the mention starts at the 3rd token in
             the document and ends at the 4th (inclusive).
-        attributes (dict(str, object)): A mapping of attribute names to
-            attribute values. 
+        tokens (list(str)): The tokens of the mention.
+        speaker (list(str)): The signers of the mention's tokens.
+        signer_ids (np.ndarray): The signer ids of the mention's tokens (see
+            Document.signer_ids).
+        mcp (np.ndarray): The finger MCP coordinates of the mention's tokens.
+        tip (np.ndarray): The finger tip coordinates of the mention's tokens.
+        normalized_id (int): The normalized id of the mention's first gloss
+            (see features.GlossVocabulary).
+        gloss_class (int): The class code of the mention's first gloss (see
+            features.gloss_class).
+        noun_like (bool): Whether the mention's first gloss is noun-like
+            (see features.is_noun_like).
+        sentence_id (int): The index of the sentence embedding the mention.
+        first_in_gold_entity (bool): Whether the mention is the first one of
+            its annotated entity.
+        annotated_set_id (int): The annotated coreference set id.
+        antecedent (Mention): The antecedent chosen by the decoder.
+        set_id (int): The coreference set id chosen by the decoder.
+        attributes (MentionAttributes): A mapping of attribute names to
+            attribute values, kept for callers of the dict-based interface.
     """
-    def __init__(self, document, span, attributes):
+    __slots__ = ("_document", "_span", "_hash", "_is_dummy", "sentence_id",
+                 "first_in_gold_entity", "annotated_set_id", "antecedent",
+                 "set_id", "_extra", "normalized_id", "gloss_class",
+                 "noun_like")
+
+    def __init__(self, document, span, attributes=None, sentence_id=None,
+                 first_in_gold_entity=False, annotated_set_id=None,
+                 is_dummy=False):
         """ Initialize a mention in a document.
         Args:
             document (CoNLLDocument): The document the mention belongs to.
             span (Span): The span of the mention in its document.
             attributes (dict(str, object)): A mapping of attribute names to
-                attribute values (see the class documentation for more
-                information).
+                additional attribute values (see the class documentation
+                for more information).
+            sentence_id (int): The index of the sentence embedding the
+                mention.
+            first_in_gold_entity (bool): Whether the mention is the first
+                one of its annotated entity.
+            annotated_set_id (int): The annotated coreference set id.
+            is_dummy (bool): Whether this is the dummy mention.
         """
-        self.document = document
-        self.span = span
-        self.attributes = attributes
+        self._document = document
+        self._span = span
+        self._is_dummy = is_dummy
+        self.sentence_id = sentence_id
+        self.first_in_gold_entity = first_in_gold_entity
+        self.annotated_set_id = annotated_set_id
+        self.antecedent = None
+        self.set_id = None
+        self._extra = None
+
+        if document is None:
+            self._hash = hash((span.begin, span.end))
+        elif span is None:
+            self._hash = hash(document.identifier)
+        else:
+            self._hash = hash((document.identifier, span.begin, span.end))
+
+        if document is None or span is None:
+            self.normalized_id = self.gloss_class = self.noun_like = None
+        else:
+            self.normalized_id, self.gloss_class, self.noun_like = \
+                document.get_gloss_codes(span.begin)
+
+        if attributes:
+            self.attributes.update(attributes)
+
+    @property
+    def document(self):
+        return self._document
+
+    @property
+    def span(self):
+        return self._span
+
+    @property
+    def attributes(self):
+        return MentionAttributes(self)
+
+    @property
+    def tokens(self):
+        if self._span is None:
+            return []
+        return self._document.tokens[self._span.begin:self._span.end + 1]
+
+    @property
+    def speaker(self):
+        return self._document.speakers[self._span.begin:self._span.end + 1]
+
+    @property
+    def signer_ids(self):
+        return self._document.signer_ids[self._span.begin:self._span.end + 1]
+
+    @property
+    def mcp(self):
+        return self._document.mcp[self._span.begin:self._span.end + 1]
+
+    @property
+    def tip(self):
+        return self._document.tip[self._span.begin:self._span.end + 1]
 
     @staticmethod
     def dummy_from_document(document):
 
-        return Mention(document, None, {
-            "is_dummy": True,
-            "annotated_set_id": None,
-            "tokens": [],
-            "first_in_gold_entity": True
-        })
+        return Mention(document, None, first_in_gold_entity=True,
+                       is_dummy=True)
 
     def is_dummy(self):
-        return "is_dummy" in self.attributes and self.attributes["is_dummy"]
+        return self._is_dummy
 
 
     @staticmethod
@@ -56,32 +144,33 @@ class Mention:
 
         i, sentence_span = document.get_sentence_id_and_span(span)
 
-        try:
-            attributes = {
-                "tokens": document.tokens[span.begin:span.end + 1],
-                "sentence_id": i,
-                "speaker": document.speakers[span.begin:span.end + 1],
-                "antecedent": None,
-                "set_id": None,
-                "first_in_gold_entity": first_in_gold_entity,
-                "mcp": document.mcp[span.begin:span.end + 1],
-                "tip": document.tip[span.begin:span.end + 1]
-            }
-        except:
-            attributes = {
-            "tokens": document.tokens[span.begin:span.end + 1],
-            "sentence_id": i,
-            "antecedent": None,
-            "set_id": None,
-            "first_in_gold_entity": first_in_gold_entity,
-        }
-
-        if span in document.coref:
-            attributes["annotated_set_id"] = document.coref[span]
-        else:
-            attributes["annotated_set_id"] = None
+        return Mention(document, span,
+                       sentence_id=i,
+                       first_in_gold_entity=first_in_gold_entity,
+                       annotated_set_id=document.coref.get(span))
+
+    @staticmethod
+    def from_document_spans(spans, document):
+        """
+        Create mentions from many spans in a document at once, resolving
+        the sentences of all spans in one pass (see from_document).
+        Args:
+            spans (list(Span)): The spans of the mentions in the document.
+            document (CoNLLDocument): The document the mentions belong to.
+        Returns:
+            list(Mention): The mentions extracted from the spans, in the
+            order of the spans.
+        """
+        sentence_ids = document.get_sentence_ids(spans).tolist()
+
+        for span, i in zip(spans, sentence_ids):
+            if i == -1:
+                raise ValueError("No sentence embeds span " + str(span))
 
-        return Mention(document, span, attributes)
+        return [Mention(document, span,
+                        sentence_id=i,
+                        annotated_set_id=document.coref.get(span))
+                for span, i in zip(spans, sentence_ids)]
 
     @staticmethod
     def _get_ancestry(dep_tree, index, level=0):
@@ -117,12 +206,12 @@ class Mention:
             True if this mention is less than other, False otherwise.
         """
 
-        if self.span is None:
-            return other.span is not None
-        elif other.span is None:
+        if self._span is None:
+            return other._span is not None
+        elif other._span is None:
             return False
         else:
-            return self.span < other.span
+            return self._span._key < other._span._key
 
     def __eq__(self, other):
         """ Check for equality.
@@ -134,8 +223,12 @@ class Mention:
             True if the mentions are in the same document and have the same
             span.
         """
-        if isinstance(other, self.__class__):
-            return self.span == other.span and self.document == other.document
+        if self is other:
+            return True
+        elif isinstance(other, Mention):
+            return self._hash == other._hash \
+                and self._span == other._span \
+                and self._document == other._document
         else:
             return False
 
@@ -143,28 +236,21 @@ class Mention:
         return not self.__eq__(other)
 
     def __hash__(self):
-        if self.document is None:
-            return hash((self.span.begin, self.span.end))
-        elif self.span is None:
-            return hash(self.document.identifier)
-        else:
-            return hash((self.document.identifier,
-                         self.span.begin,
-                         self.span.end))
+        return self._hash
 
     def __str__(self):
         return (repr(self.document) +
                 ", " +
                 str(self.span) +
                 ": "
-                + " ".join(self.attributes["tokens"]))
+                + " ".join(self.tokens))
 
     def __repr__(self):
         return (repr(self.document) +
                 ", " +
                 str(self.span) +
                 ": " +
-                str(self.attributes["tokens"]))
+                str(self.tokens))
 
     def get_context(self, window):
         """ Get the context in a window around the mention.
@@ -194,8 +280,8 @@ class Mention:
             and have the same annotated set id), False otherwise.
         """
 
-        self_set_id = self.attributes['annotated_set_id']
-        m_set_id = m.attributes['annotated_set_id']
+        self_set_id = self.annotated_set_id
+        m_set_id = m.annotated_set_id
 
         if self.document is None and m.document is None:
             return self_set_id is not None and self_set_id == m_set_id
@@ -225,10 +311,67 @@ class Mention:
         if self.is_coreferent_with(m):
             return True
         elif self.is_dummy():
-            return m.attributes['annotated_set_id'] is None \
-                   or m.attributes["first_in_gold_entity"]
+            return m.annotated_set_id is None \
+                   or m.first_in_gold_entity
         elif m.is_dummy():
-            return self.attributes['annotated_set_id'] is None \
-                   or self.attributes["first_in_gold_entity"]
+            return self.annotated_set_id is None \
+                   or self.first_in_gold_entity
         else:
             return False
+
+
+class MentionAttributes(MutableMapping):
+    """ A dict-like view on the attributes of a mention.
+    Keys naming a field of the mention read and write that field, the keys
+    derived from the document ("tokens", "speaker", "mcp", "tip",
+    "normalized_id", "gloss_class", "noun_like", "is_dummy") are read-only. Any other key is stored with the mention.
+    """
+    FIELDS = ("sentence_id", "first_in_gold_entity", "annotated_set_id",
+              "antecedent", "set_id")
+    DERIVED = ("tokens", "speaker", "mcp", "tip", "normalized_id",
+               "gloss_class", "noun_like")
+
+    __slots__ = ("_mention",)
+
+    def __init__(self, mention):
+        self._mention = mention
+
+    def __getitem__(self, key):
+        mention = self._mention
+        if key in MentionAttributes.FIELDS or \
+                key in MentionAttributes.DERIVED:
+            return getattr(mention, key)
+        elif key == "is_dummy":
+            return mention.is_dummy()
+        elif mention._extra is not None and key in mention._extra:
+            return mention._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        mention = self._mention
+        if key in MentionAttributes.FIELDS:
+            setattr(mention, key, value)
+        elif key in MentionAttributes.DERIVED or key == "is_dummy":
+            raise TypeError("Mention attribute " + key + " is read-only")
+        else:
+            if mention._extra is None:
+                mention._extra = {}
+            mention._extra[key] = value
+
+    def __delitem__(self, key):
+        mention = self._mention
+        if mention._extra is None or key not in mention._extra:
+            raise TypeError("Mention attribute " + str(key) +
+                            " cannot be deleted")
+        del mention._extra[key]
+
+    def __iter__(self):
+        yield from MentionAttributes.FIELDS
+        yield "is_dummy"
+        if not self._mention.is_dummy():
+            yield from MentionAttributes.DERIVED
+        if self._mention._extra is not None:
+            yield from self._mention._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -2,23 +2,123 @@
 Adapted from https://github.com/smartschat/cort
 """
 
+import numpy as np
+
+from multigraph import features as multigraph_features
+from multigraph.candidates import CandidateGenerator, feature_support
+
 
 class CorefMultigraph:
-    def __init__(self, nodes, edges):
+    def __init__(self, nodes, edges, indptr=None, antecedents=None,
+                 weights=None):
         self.nodes = nodes
         self.edges = edges
+        # summed edge weights in compressed row format, see
+        # CorefMultigraphCreator.construct_weighted_graph_from_mentions
+        self.indptr = indptr
+        self.antecedents = antecedents
+        self.weights = weights
+        self.positions = {node: i for i, node in enumerate(nodes)}
 
     def get_weight(self, anaphor, antecedent):
+        if self.weights is not None:
+            i = self.positions[anaphor]
+            row = slice(self.indptr[i], self.indptr[i+1])
+            k = np.flatnonzero(
+                self.antecedents[row] == self.positions[antecedent])[0]
+            return self.weights[row][k]
+
         weight = 0.0
         for relation in self.edges[anaphor][antecedent]:
             weight += relation
         return weight
 
+    def get_candidate_weights(self, anaphor):
+        """ Get the candidate antecedents of a mention and their weights.
+        Only available if the weights are stored in arrays.
+        Args:
+            anaphor (Mention): A mention of the graph.
+        Returns:
+            (np.ndarray, np.ndarray): The positions of the candidates
+            (closest first) and the weights of the edges to them.
+        """
+        i = self.positions[anaphor]
+        row = slice(self.indptr[i], self.indptr[i+1])
+        return self.antecedents[row], self.weights[row]
+
+
+class LazyCorefMultigraph(CorefMultigraph):
+    """ A multigraph whose edge weights are computed when they are asked for.
+
+    Neither edges nor weights are stored, only per-mention data, so memory
+    is linear in the number of mentions. Feature evaluation for an edge
+    stops as soon as a feature returns -inf; the weight of such an edge is
+    -inf.
+    """
+    def __init__(self, nodes, creator, arrays, candidates):
+        super(LazyCorefMultigraph, self).__init__(nodes, None)
+        self.creator = creator
+        self.arrays = arrays
+        self.candidates = candidates
+
+    def get_weight(self, anaphor, antecedent):
+        weight = 0.0
+        for r in self.creator.features:
+            relation = r(anaphor, antecedent)
+            if relation == -np.inf:
+                return relation
+            weight += relation
+        return weight
+
+    def get_candidate_weights(self, anaphor):
+        i = self.positions[anaphor]
+        antecedents = self.candidates.row(i)
+
+        if self.creator.batch_features is None:
+            weights = np.array([self.get_weight(anaphor, self.nodes[j])
+                                for j in antecedents], dtype=np.float64)
+            return antecedents, weights
+
+        weights = np.zeros(len(antecedents), dtype=np.float64)
+        alive = np.arange(len(antecedents))
+        for r in self.creator.batch_features:
+            relations = r(self.arrays, i, antecedents[alive])
+            weights[alive] += relations
+            alive = alive[relations != -np.inf]
+            if len(alive) == 0:
+                break
+
+        return antecedents, weights
+
+
 class CorefMultigraphCreator:
-    def __init__(self, features):
+    def __init__(self, features, batch=True, candidates=None, lazy=False,
+                 block_size=2**20):
         self.features = features
+        self.lazy = lazy
+        self.block_size = block_size
+        # by default, only visit the pairs some feature can be positive on
+        self.candidates = candidates if candidates is not None \
+            else CandidateGenerator(support=feature_support(features))
+        # the batch engine is only used if every feature has a batch version
+        self.batch_features = None
+        if batch and all(r in multigraph_features.BATCH_FEATURES
+                         for r in features):
+            self.batch_features = [multigraph_features.BATCH_FEATURES[r]
+                                   for r in features]
 
     def construct_graph_from_mentions(self, mentions):
+        if self.lazy:
+            arrays = multigraph_features.MentionArrays(mentions)
+            return LazyCorefMultigraph(list(mentions), self, arrays,
+                                       self.candidates.for_document(arrays))
+
+        if self.batch_features is not None:
+            return self.construct_weighted_graph_from_mentions(mentions)
+
+        indptr, antecedents = self.candidates.generate(
+            multigraph_features.MentionArrays(mentions))
+
         nodes = []
         edges = {}
 
@@ -27,18 +127,50 @@ class CorefMultigraphCreator:
 
             nodes.append(anaphor)
 
-            edges[anaphor] = self.construct_for_one_mention(mentions, i)
+            edges[anaphor] = self.construct_for_one_mention(
+                mentions, i, antecedents[indptr[i]:indptr[i+1]])
 
         return CorefMultigraph(nodes,
                                edges)
 
-    def construct_for_one_mention(self, mentions, i):
+    def construct_weighted_graph_from_mentions(self, mentions):
+        """ Compute all edge weights of a document with the batch features.
+        The candidate antecedents of mentions[i] in the resulting graph are
+        ``antecedents[indptr[i]:indptr[i+1]]`` (closest first), the summed
+        feature values of these edges are stored at the same positions in
+        ``weights``.
+        Args:
+            mentions (list(Mention)): The (non-dummy) mentions of a document.
+        Returns:
+            CorefMultigraph: A graph whose edge weights are stored in
+            arrays.
+        """
+        arrays = multigraph_features.MentionArrays(mentions)
+        indptr, antecedents = self.candidates.generate(arrays)
+        anaphors = np.repeat(np.arange(len(mentions), dtype=np.int64),
+                             np.diff(indptr))
+        weights = np.zeros(len(antecedents), dtype=np.float64)
+
+        for start in range(0, len(antecedents), self.block_size):
+            block = slice(start, start + self.block_size)
+            # sum in feature order to reproduce get_weight exactly
+            for r in self.batch_features:
+                weights[block] += r(arrays, anaphors[block],
+                                    antecedents[block])
+
+        return CorefMultigraph(list(mentions), None, indptr, antecedents,
+                               weights)
+
+    def construct_for_one_mention(self, mentions, i, candidates=None):
         anaphor = mentions[i]
 
         edges = {}
 
-        # do not include dummy mention
-        for j in range(i-1, 0, -1):
+        if candidates is None:
+            # do not include dummy mention
+            candidates = range(i-1, 0, -1)
+
+        for j in candidates:
             antecedent = mentions[j]
             edges[antecedent] = self.get_edge_relations(anaphor, antecedent)
 
@@ -50,5 +182,3 @@ class CorefMultigraphCreator:
             relations.append(r(anaphor, antecedent))
 
         return relations
-
-
@@ -0,0 +1,344 @@
+""" Profile the stages of the multigraph pipeline, per stage and per
+document."""
+
+import contextlib
+import functools
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class FeatureStatistics:
+    """ How often, and at which cost, a feature was evaluated.
+    Attributes:
+        evaluations (int): The number of edges the feature was evaluated on.
+        fired (int): The number of edges it gave a finite non-zero value.
+        minus_inf (int): The number of edges it gave -inf.
+        seconds (float): The time spent in the feature.
+    """
+    def __init__(self):
+        self.evaluations = 0
+        self.fired = 0
+        self.minus_inf = 0
+        self.seconds = 0.0
+
+    def add(self, relations, seconds):
+        """ Record the values of an evaluation.
+        Args:
+            relations (np.ndarray or float): The values of the feature on
+                the edges it was evaluated on.
+            seconds (float): The time the evaluation took.
+        """
+        if np.ndim(relations) == 0:
+            self.evaluations += 1
+            if relations == -np.inf:
+                self.minus_inf += 1
+            elif relations != 0:
+                self.fired += 1
+        else:
+            minus_inf = int(np.count_nonzero(relations == -np.inf))
+            self.evaluations += len(relations)
+            self.minus_inf += minus_inf
+            self.fired += int(np.count_nonzero(relations)) - minus_inf
+        self.seconds += seconds
+
+    def to_json(self):
+        return {"evaluations": self.evaluations,
+                "fired": self.fired,
+                "minus_inf": self.minus_inf,
+                "seconds": self.seconds}
+
+
+class DocumentProfile:
+    """ The measurements of one document.
+    Attributes:
+        identifier (str): The identifier of the document.
+        glosses (int): The number of glosses of the document.
+        mentions (int): The number of system mentions (without the dummy
+            mention), once they are extracted.
+        edges (int): The number of candidate edges visited while decoding.
+        stages (dict(str, dict)): The seconds and peak bytes allocated of
+            every stage the document went through.
+        features (dict(str, FeatureStatistics)): The feature evaluations
+            on the edges of the document.
+    """
+    def __init__(self, document):
+        self.identifier = document.identifier
+        self.glosses = len(document.tokens)
+        self.mentions = None
+        self.edges = 0
+        self.stages = {}
+        self.features = {}
+
+    def to_json(self):
+        return {"document": self.identifier,
+                "glosses": self.glosses,
+                "mentions": self.mentions,
+                "edges": self.edges,
+                "seconds": sum(stage["seconds"]
+                               for name, stage in self.stages.items()
+                               if name not in Profiler.INCLUDED_STAGES),
+                "stages": self.stages,
+                "features": {name: statistics.to_json() for name, statistics
+                             in self.features.items()}}
+
+
+class Profiler:
+    """ Records the wall time and the allocations of the stages of a run,
+    both in total and per document, and how the features of a decoder
+    behave (see instrument).
+
+    Allocations are the peak of the memory allocated while a stage runs,
+    on top of what was allocated when it started, as traced by
+    tracemalloc. Tracing slows Python code down (more so code which
+    allocates much), so times are only comparable between profiled runs.
+
+    A disabled profiler measures nothing, so a pipeline can use one
+    unconditionally.
+
+    Attributes:
+        enabled (bool): Whether anything is measured.
+        trace_memory (bool): Whether allocations are measured.
+        stages (dict(str, dict)): The seconds and peak bytes allocated of
+            every stage of the run.
+        documents (dict(str, DocumentProfile)): The measurements of every
+            document, by identifier, in the order the documents were first
+            measured.
+        features (dict(str, FeatureStatistics)): The feature evaluations of
+            the whole run.
+    """
+    # per document stages whose measurements include other stages
+    INCLUDED_STAGES = ("graph",)
+
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.documents = {}
+        self.features = {}
+
+        self.__current = None
+        # the open measurements, their peaks are raised by nested ones
+        self.__open = []
+        self.__started_tracing = False
+
+    def start(self):
+        """ Start tracing allocations (if enabled). """
+        if self.enabled and self.trace_memory and \
+                not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+
+    def stop(self):
+        """ Stop tracing allocations, if start started it. """
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    def stage(self, name):
+        """ Measure a stage of the run.
+        Args:
+            name (str): The name of the stage.
+        Returns:
+            A context manager measuring the code it runs.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.__measure(self.stages, name)
+
+    def measure(self, document, name):
+        """ Measure a stage of a document. Features evaluated meanwhile are
+        attributed to the document.
+        Args:
+            document (Document): The document.
+            name (str): The name of the stage.
+        Returns:
+            A context manager measuring the code it runs.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.__measure_document(self.get_document(document), name)
+
+    def iter_documents(self, documents, name="read"):
+        """ Measure the production of every document of an iterator, for
+        example reading them from a file.
+        Args:
+            documents (iterable(Document)): The documents.
+            name (str): The name of the stage.
+        Returns:
+            An iterator over the documents.
+        """
+        if not self.enabled:
+            yield from documents
+            return
+
+        iterator = iter(documents)
+        while True:
+            measurement = _Measurement(self.__open)
+            measurement.begin()
+            try:
+                document = next(iterator)
+            except StopIteration:
+                measurement.end()
+                return
+            measurement.end()
+            self.get_document(document).stages[name] = measurement.to_json()
+            yield document
+
+    def get_document(self, document):
+        """ Get the profile of a document.
+        Args:
+            document (Document): The document.
+        Returns:
+            DocumentProfile: Its profile, created if there was none yet.
+        """
+        profile = self.documents.get(document.identifier)
+        if profile is None:
+            profile = DocumentProfile(document)
+            self.documents[document.identifier] = profile
+        return profile
+
+    def instrument(self, decoder):
+        """ Measure the graph construction, the decoding and the feature
+        evaluations of every document a decoder decodes serially.
+
+        The features of the decoder's multigraph creator are replaced by
+        counting wrappers, which cannot be sent to worker processes.
+
+        Args:
+            decoder (MultigraphDecoder): The decoder.
+        """
+        if not self.enabled:
+            return
+
+        creator = decoder.coref_multigraph_creator
+        features = creator.features
+        creator.features = [self.__wrap_feature(r, r.__name__)
+                            for r in features]
+        # a batch feature counts as the feature it computes
+        if creator.batch_features is not None:
+            creator.batch_features = [
+                self.__wrap_feature(batch_r, r.__name__)
+                for batch_r, r in zip(creator.batch_features, features)]
+
+        construct_graph = creator.construct_graph_from_mentions
+        decode = decoder.decode_for_one_document
+
+        @functools.wraps(construct_graph)
+        def construct_graph_from_mentions(mentions):
+            if not mentions:
+                return construct_graph(mentions)
+
+            with self.measure(mentions[0].document, "graph"):
+                return construct_graph(mentions)
+
+        @functools.wraps(decode)
+        def decode_for_one_document(mentions, multigraph=None):
+            if not mentions:
+                return decode(mentions, multigraph)
+
+            profile = self.get_document(mentions[0].document)
+            profile.mentions = len(mentions)
+            num_candidates = creator.candidates.num_candidates
+            with self.__measure_document(profile, "decode"):
+                decode(mentions, multigraph)
+            profile.edges += creator.candidates.num_candidates - \
+                num_candidates
+
+        creator.construct_graph_from_mentions = construct_graph_from_mentions
+        decoder.decode_for_one_document = decode_for_one_document
+
+    def to_json(self):
+        """ Get the report of the run.
+        Returns:
+            dict: The stages, documents (slowest first) and features of the
+            run.
+        """
+        documents = sorted((profile.to_json()
+                            for profile in self.documents.values()),
+                           key=lambda document: -document["seconds"])
+        return {"stages": self.stages,
+                "documents": documents,
+                "edges": sum(document["edges"] for document in documents),
+                "features": {name: statistics.to_json() for name, statistics
+                             in self.features.items()}}
+
+    @contextlib.contextmanager
+    def __measure(self, stages, name):
+        measurement = _Measurement(self.__open)
+        measurement.begin()
+        try:
+            yield
+        finally:
+            measurement.end()
+            stages[name] = measurement.to_json()
+
+    @contextlib.contextmanager
+    def __measure_document(self, profile, name):
+        previous = self.__current
+        self.__current = profile
+        try:
+            with self.__measure(profile.stages, name):
+                yield
+        finally:
+            self.__current = previous
+
+    def __wrap_feature(self, r, name):
+        totals = self.features.setdefault(name, FeatureStatistics())
+
+        @functools.wraps(r)
+        def wrapped(*args):
+            started = time.perf_counter()
+            relations = r(*args)
+            seconds = time.perf_counter() - started
+
+            totals.add(relations, seconds)
+            if self.__current is not None:
+                statistics = self.__current.features.get(name)
+                if statistics is None:
+                    statistics = FeatureStatistics()
+                    self.__current.features[name] = statistics
+                statistics.add(relations, seconds)
+            return relations
+
+        return wrapped
+
+
+class _Measurement:
+    """ The time and the allocations of one run of a stage. Nested
+    measurements pass their peak on to the enclosing ones, as resetting
+    the peak of tracemalloc loses it. """
+    def __init__(self, open_measurements):
+        self.open = open_measurements
+        self.tracing = False
+        self.started = None
+        self.seconds = None
+        self.start_bytes = 0
+        self.peak_bytes = 0
+
+    def begin(self):
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            for measurement in self.open:
+                measurement.peak_bytes = max(measurement.peak_bytes, peak)
+            tracemalloc.reset_peak()
+            self.start_bytes = self.peak_bytes = current
+        self.open.append(self)
+        self.started = time.perf_counter()
+
+    def end(self):
+        self.seconds = time.perf_counter() - self.started
+        self.open.remove(self)
+        if self.tracing:
+            peak = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            self.peak_bytes = peak
+            for measurement in self.open:
+                measurement.peak_bytes = max(measurement.peak_bytes, peak)
+
+    def to_json(self):
+        measured = {"seconds": self.seconds}
+        if self.tracing:
+            measured["peak_bytes"] = self.peak_bytes - self.start_bytes
+        return measured
@@ -0,0 +1,228 @@
+""" Resolve coreference online, one gloss at a time."""
+
+from collections import deque, namedtuple
+
+import numpy as np
+
+from multigraph import features as multigraph_features
+from multigraph.mentions import Mention
+from multigraph.spans import Span
+
+Decision = namedtuple("Decision", "mention antecedent")
+
+
+class _Column:
+    """ A column of a gloss stream which only holds the values of the
+    positions that are still needed. Supports the slicing done by Mention.
+    """
+    def __init__(self):
+        self.values = {}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.values[i] for i in range(index.start, index.stop)]
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        self.values[index] = value
+
+    def __delitem__(self, index):
+        del self.values[index]
+
+
+class GlossStream:
+    """ The document formed by a live stream of glosses, as far as the
+    features read it. Positions are global (the nth gloss has position n),
+    but the columns only keep the glosses which can still be candidate
+    antecedents, see forget.
+    Attributes:
+        identifier (str): A unique identifier for the stream.
+        tokens: The gloss of every kept position.
+        signers (list(str)): All distinct signers, in order of first
+            occurrence.
+        speakers: The signer of every kept position.
+        signer_ids: Index into signers of every kept position.
+        mcp: Finger MCP coordinates of every kept position.
+        tip: Finger tip coordinates of every kept position.
+        start_times: Start timestamp of every kept position (-1 if
+            unknown).
+        end_times: End timestamp of every kept position (-1 if unknown).
+        coref (dict(Span, int)): Always empty, streams are not annotated.
+    """
+    COLUMNS = ("tokens", "speakers", "signer_ids", "mcp", "tip",
+               "start_times", "end_times")
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+        self.signers = []
+        self.coref = {}
+        self.length = 0
+        self.__signer_ids = {}
+        for name in GlossStream.COLUMNS:
+            setattr(self, name, _Column())
+
+    def append(self, gloss, signer):
+        """ Append a gloss to the stream.
+        Args:
+            gloss (dict): The gloss, with the keys of the glosses of the
+                corpus files ('Lexeme_Sign', 'FINGER_MCP', 'FINGER_TIP' and
+                optionally 'start' and 'end').
+            signer (str): The signer of the gloss.
+        Returns:
+            int: The position of the gloss.
+        """
+        if signer not in self.__signer_ids:
+            self.__signer_ids[signer] = len(self.signers)
+            self.signers.append(signer)
+
+        position = self.length
+        self.tokens[position] = gloss['Lexeme_Sign']
+        self.speakers[position] = signer
+        self.signer_ids[position] = self.__signer_ids[signer]
+        self.mcp[position] = np.array(gloss['FINGER_MCP'], dtype=np.float64)
+        self.tip[position] = np.array(gloss['FINGER_TIP'], dtype=np.float64)
+        self.start_times[position] = gloss.get('start', -1)
+        self.end_times[position] = gloss.get('end', -1)
+        self.length += 1
+
+        return position
+
+    def get_gloss_codes(self, position):
+        """ Get the codes of the gloss at a position, see
+        Document.get_gloss_codes. """
+        return multigraph_features.GLOSSES.lookup(self.tokens[position])
+
+    def forget(self, position):
+        """ Drop the values of a position which is no longer needed. """
+        for name in GlossStream.COLUMNS:
+            del getattr(self, name)[position]
+
+    def __repr__(self):
+        return self.identifier
+
+    def __len__(self):
+        return self.length
+
+
+class OnlineResolver:
+    """ Resolve the glosses of a live stream as they arrive.
+
+    Every gloss is a mention. Its antecedent is chosen among the mentions of
+    the last window glosses and the latest mention of each combination of
+    signer and I/YOU/INDEX gloss class, with the weights and tie-breaking
+    of MultigraphDecoder (graph=True). This makes the same decisions as the
+    multigraph decoder on the full graph of the replayed document whenever
+    an edge to an antecedent outside the window has a positive weight only
+    if it has the same weight for all antecedents of the same signer and
+    gloss class. All features in the features module satisfy this for a
+    window of at least 100 glosses (the range of spatially_close and
+    temporally_close).
+
+    The work per gloss is bounded by the window size and the number of
+    signers, and only the data of possible antecedents is kept.
+
+    Attributes:
+        features (list(function)): The features, as passed to
+            CorefMultigraphCreator.
+        window (int): The number of preceding glosses which are always
+            candidates.
+        stream (GlossStream): The glosses seen so far.
+        clusters (dict(int, list(Span))): The spans of the mentions of every
+            coreference set found so far.
+    """
+    def __init__(self, features, window=100, identifier="stream"):
+        self.features = features
+        self.window = window
+        self.stream = GlossStream(identifier)
+        self.clusters = {}
+
+        # candidates in the window, oldest first
+        self.__recent = deque()
+        # latest candidate of each (signer id, gloss class)
+        self.__latest = {}
+
+    def push(self, gloss, signer):
+        """ Resolve the next gloss of the stream.
+        Args:
+            gloss (dict): The gloss, see GlossStream.append.
+            signer (str): The signer of the gloss.
+        Returns:
+            Decision: The mention of the gloss (with its set id) and its
+            antecedent (None if it has none). The mention's data can be read
+            until the next call of push.
+        """
+        position = self.stream.length
+        self.__evict(position)
+
+        self.stream.append(gloss, signer)
+        mention = Mention(self.stream, Span(position, position),
+                          sentence_id=0)
+
+        antecedent = self.__compute_antecedent(mention)
+
+        if antecedent is not None:
+            if antecedent.set_id is None:
+                antecedent.set_id = antecedent.span.begin
+                self.clusters[antecedent.set_id] = [antecedent.span]
+            mention.set_id = antecedent.set_id
+            self.clusters[mention.set_id].append(mention.span)
+
+        # the first mention is never an antecedent
+        if position > 0:
+            self.__recent.append(mention)
+            if mention.gloss_class != multigraph_features.OTHER_CLASS:
+                key = (self.stream.signer_ids[position], mention.gloss_class)
+                previous = self.__latest.get(key)
+                self.__latest[key] = mention
+                if previous is not None and not self.__in_window(previous):
+                    self.stream.forget(previous.span.begin)
+
+        return Decision(mention, antecedent)
+
+    def __in_window(self, mention):
+        return bool(self.__recent) and \
+            mention.span.begin >= self.__recent[0].span.begin
+
+    def __evict(self, position):
+        if position == 1:
+            # the first mention was never a candidate
+            self.stream.forget(0)
+
+        latest = set(self.__latest.values())
+        while self.__recent and \
+                position - self.__recent[0].span.end >= self.window:
+            mention = self.__recent.popleft()
+            if mention not in latest:
+                self.stream.forget(mention.span.begin)
+
+    def __candidates(self):
+        candidates = list(self.__recent)
+        candidates += [mention for mention in self.__latest.values()
+                       if not self.__in_window(mention)]
+        return candidates
+
+    def __get_weight(self, anaphor, antecedent):
+        weight = 0.0
+        for r in self.features:
+            relation = r(anaphor, antecedent)
+            if relation == -np.inf:
+                return relation
+            weight += relation
+        return weight
+
+    def __compute_antecedent(self, mention):
+        best = None
+        best_weight = 0.0
+
+        for antecedent in self.__candidates():
+            weight = self.__get_weight(mention, antecedent)
+
+            # fails for -inf and nan weights
+            if weight > 0:
+                if best is None or weight > best_weight or (
+                        weight == best_weight and
+                        antecedent.span.begin > best.span.begin):
+                    best = antecedent
+                    best_weight = weight
+
+        return best
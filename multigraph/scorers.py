@@ -0,0 +1,325 @@
+""" Score coreference decisions in process.
+
+Computes the metrics of the reference CoNLL scorer (scorer.pl): MUC, B3,
+CEAF (mention- and entity-based), BLANC and LEA. The key entities of a
+document are read from ``Document.coref``, the response entities from the
+``set_id`` of its system mentions, as written by Document.to_simple_output
+and converted by format_conll.py. Like scorer.pl, numerators and
+denominators are summed over the documents of a corpus.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+METRICS = ("muc", "bcub", "ceafm", "ceafe", "blanc", "lea")
+
+Score = namedtuple("Score", "recall_num recall_den precision_num precision_den")
+
+
+class Contingency:
+    """ Overlap of the key and response entities of a document.
+    Attributes:
+        counts (np.ndarray): counts[k, r] is the number of mentions shared by
+            key entity k and response entity r.
+        key_sizes (np.ndarray): The number of mentions of each key entity.
+        response_sizes (np.ndarray): The number of mentions of each response
+            entity.
+    """
+    def __init__(self, key, response):
+        """ Build the contingency matrix of two clusterings.
+        Args:
+            key (dict(Span, object)): A mapping of key mention spans to
+                their entity.
+            response (dict(Span, object)): A mapping of response mention
+                spans to their entity.
+        """
+        key_entities = {}
+        response_entities = {}
+        key_ids = np.array([key_entities.setdefault(e, len(key_entities))
+                            for e in key.values()], dtype=np.int64)
+        response_ids = np.array(
+            [response_entities.setdefault(e, len(response_entities))
+             for e in response.values()], dtype=np.int64)
+
+        self.key_sizes = np.bincount(key_ids, minlength=len(key_entities))
+        self.response_sizes = np.bincount(response_ids,
+                                          minlength=len(response_entities))
+
+        response_positions = {span: i for i, span in enumerate(response)}
+        shared = [(k, response_positions[span]) for k, span
+                  in zip(key_ids.tolist(), key) if span in response_positions]
+
+        self.counts = np.zeros((len(key_entities), len(response_entities)),
+                               dtype=np.int64)
+        if shared:
+            rows, columns = np.array(shared, dtype=np.int64).T
+            np.add.at(self.counts, (rows, response_ids[columns]), 1)
+
+    def transposed(self):
+        contingency = Contingency.__new__(Contingency)
+        contingency.counts = self.counts.T
+        contingency.key_sizes = self.response_sizes
+        contingency.response_sizes = self.key_sizes
+        return contingency
+
+
+def key_from_document(document):
+    """ Get the annotated entities of a document.
+    Returns:
+        dict(Span, object): A mapping of mention spans to entities.
+    """
+    return dict(document.coref)
+
+
+def response_from_document(document):
+    """ Get the entities the decoder assigned to a document's system
+    mentions. As in the output of Document.to_simple_output, mentions without
+    a (truthy) set id are not part of any entity.
+    Returns:
+        dict(Span, object): A mapping of mention spans to entities.
+    """
+    return {mention.span: mention.set_id
+            for mention in document.system_mentions
+            if not mention.is_dummy() and mention.set_id}
+
+
+def _links(sizes):
+    return sizes * (sizes - 1) // 2
+
+
+def muc(contingency):
+    def recall(c):
+        # mentions missing from the response are partitions of their own
+        partitions = np.count_nonzero(c.counts, axis=1) + \
+            c.key_sizes - c.counts.sum(axis=1)
+        return (c.key_sizes - partitions).sum(), (c.key_sizes - 1).clip(0).sum()
+
+    recall_num, recall_den = recall(contingency)
+    precision_num, precision_den = recall(contingency.transposed())
+    return Score(recall_num, recall_den, precision_num, precision_den)
+
+
+def bcub(contingency):
+    squares = contingency.counts.astype(np.float64) ** 2
+    recall_num = (squares.sum(axis=1)[contingency.key_sizes > 0] /
+                  contingency.key_sizes[contingency.key_sizes > 0]).sum()
+    precision_num = (squares.sum(axis=0)[contingency.response_sizes > 0] /
+                     contingency.response_sizes[
+                         contingency.response_sizes > 0]).sum()
+    return Score(recall_num, contingency.key_sizes.sum(),
+                 precision_num, contingency.response_sizes.sum())
+
+
+def _max_assignment(similarity):
+    """ Compute the weight of a maximum weight matching of the rows and
+    columns of a similarity matrix. """
+    # rows and columns without any overlap cannot add to the matching
+    rows = np.flatnonzero(similarity.any(axis=1))
+    columns = np.flatnonzero(similarity.any(axis=0))
+    similarity = similarity[np.ix_(rows, columns)]
+    if similarity.size == 0:
+        return 0.0
+
+    if linear_sum_assignment is not None:
+        row_ind, col_ind = linear_sum_assignment(similarity, maximize=True)
+    else:
+        row_ind, col_ind = _hungarian(-similarity)
+    return similarity[row_ind, col_ind].sum()
+
+
+def _hungarian(cost):
+    """ Solve the rectangular assignment problem minimizing cost, with the
+    shortest augmenting path method. Returns the assigned rows and columns.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # potentials and matching use 1-based indices, 0 is a virtual column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+            if row_of[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+
+    columns = np.flatnonzero(row_of[1:])
+    rows = row_of[1:][columns] - 1
+    if transposed:
+        rows, columns = columns, rows
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+
+def ceafm(contingency):
+    similarity = contingency.counts.astype(np.float64)
+    matched = _max_assignment(similarity)
+    return Score(matched, contingency.key_sizes.sum(),
+                 matched, contingency.response_sizes.sum())
+
+
+def ceafe(contingency):
+    similarity = 2 * contingency.counts / (
+        contingency.key_sizes[:, None] + contingency.response_sizes[None, :])
+    matched = _max_assignment(similarity)
+    return Score(matched, len(contingency.key_sizes),
+                 matched, len(contingency.response_sizes))
+
+
+def lea(contingency):
+    def recall(c):
+        sizes = c.key_sizes
+        links = _links(sizes)
+        resolved = _links(c.counts).sum(axis=1).astype(np.float64)
+        # a singleton is resolved if it is a singleton of the response too
+        singleton_resolved = ((c.counts == 1) &
+                              (c.response_sizes[None, :] == 1)).any(axis=1)
+        resolution = np.where(sizes == 1, singleton_resolved,
+                              resolved / np.maximum(links, 1))
+        return (sizes * resolution).sum(), sizes.sum()
+
+    recall_num, recall_den = recall(contingency)
+    precision_num, precision_den = recall(contingency.transposed())
+    return Score(recall_num, recall_den, precision_num, precision_den)
+
+
+def blanc_counts(contingency):
+    """ Count coreference and non-coreference links of a document.
+    Returns:
+        np.ndarray: The number of coreference links in key, response and
+        both, followed by the number of non-coreference links in key,
+        response and both.
+    """
+    counts = contingency.counts
+    key_mentions = contingency.key_sizes.sum()
+    response_mentions = contingency.response_sizes.sum()
+
+    key_coref = _links(contingency.key_sizes).sum()
+    response_coref = _links(contingency.response_sizes).sum()
+    common_coref = _links(counts).sum()
+
+    # pairs of common mentions in different entities in key and response
+    common = counts.sum()
+    common_non_coref = _links(common) - _links(counts.sum(axis=1)).sum() - \
+        _links(counts.sum(axis=0)).sum() + common_coref
+
+    return np.array([key_coref, response_coref, common_coref,
+                     _links(key_mentions) - key_coref,
+                     _links(response_mentions) - response_coref,
+                     common_non_coref], dtype=np.int64)
+
+
+def _ratio(num, den):
+    return num / den if den else 0.0
+
+
+def _f1(recall, precision):
+    return _ratio(2 * recall * precision, recall + precision)
+
+
+def blanc_from_counts(counts):
+    """ Compute BLANC recall, precision and F1 from link counts summed over
+    documents (see blanc_counts).
+    """
+    key_coref, response_coref, common_coref, \
+        key_non_coref, response_non_coref, common_non_coref = counts
+
+    coref_recall = _ratio(common_coref, key_coref)
+    coref_precision = _ratio(common_coref, response_coref)
+    non_coref_recall = _ratio(common_non_coref, key_non_coref)
+    non_coref_precision = _ratio(common_non_coref, response_non_coref)
+
+    if key_coref == 0 and response_coref == 0:
+        return non_coref_recall, non_coref_precision, \
+            _f1(non_coref_recall, non_coref_precision)
+    if key_non_coref == 0 and response_non_coref == 0:
+        return coref_recall, coref_precision, \
+            _f1(coref_recall, coref_precision)
+
+    return (coref_recall + non_coref_recall) / 2, \
+        (coref_precision + non_coref_precision) / 2, \
+        (_f1(coref_recall, coref_precision) +
+         _f1(non_coref_recall, non_coref_precision)) / 2
+
+
+METRIC_FUNCTIONS = {
+    "muc": muc,
+    "bcub": bcub,
+    "ceafm": ceafm,
+    "ceafe": ceafe,
+    "lea": lea,
+}
+
+
+def score_documents(documents, metrics=METRICS):
+    """ Score the decisions on a collection of documents.
+    Args:
+        documents (iterable(Document)): Decoded documents.
+        metrics (iterable(str)): The metrics to compute, out of METRICS.
+    Returns:
+        dict(str, (float, float, float)): A mapping of metric names to
+        recall, precision and F1 (between 0 and 1).
+    """
+    totals = {metric: np.zeros(4) for metric in metrics if metric != "blanc"}
+    blanc_totals = np.zeros(6, dtype=np.int64)
+
+    for document in documents:
+        contingency = Contingency(key_from_document(document),
+                                  response_from_document(document))
+        for metric in totals:
+            totals[metric] += METRIC_FUNCTIONS[metric](contingency)
+        if "blanc" in metrics:
+            blanc_totals += blanc_counts(contingency)
+
+    scores = {}
+    for metric in metrics:
+        if metric == "blanc":
+            scores[metric] = blanc_from_counts(blanc_totals)
+        else:
+            recall_num, recall_den, precision_num, precision_den = \
+                totals[metric]
+            recall = _ratio(recall_num, recall_den)
+            precision = _ratio(precision_num, precision_den)
+            scores[metric] = (recall, precision, _f1(recall, precision))
+    return scores
+
+
+def format_scores(scores):
+    """ Format scores as a table of percentages, one metric per line. """
+    lines = ["%-6s  %7s  %9s  %7s" % ("METRIC", "Recall", "Precision", "F1")]
+    for metric, (recall, precision, f1) in scores.items():
+        lines.append("%-6s  %6.2f%%  %8.2f%%  %6.2f%%" %
+                     (metric, 100 * recall, 100 * precision, 100 * f1))
+    return "\n".join(lines)
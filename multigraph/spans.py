@@ -1,43 +1,32 @@
+__author__ = 'smartschat'
 
-class ComparableMixin:
-    """ A mixin for deducing comparison operators from __lt__. """
-    def __eq__(self, other):
-        if self is None and other is not None:
-            return False
-        elif self is not None and other is None:
-            return False
-        else:
-            return not self < other and not other < self
-
-    def __ne__(self, other):
-        return self < other or other < self
-
-    def __gt__(self, other):
-        return other < self
-
-    def __ge__(self, other):
-        return not self < other
-
-    def __le__(self, other):
-        return not other < self
 
-        __author__ = 'smartschat'
-
-
-class Span(ComparableMixin):
+class Span:
     """ Manage and compare spans in documents.
+    Spans are immutable, their hash and the tuple they are ordered by are
+    computed once on construction.
     Attributes:
         begin (int): The begin of the span.
         end (int): The end of the span (inclusive).
     """
+    __slots__ = ("begin", "end", "_key", "_hash")
+
     def __init__(self, begin, end):
         """ Initialize a span from a begin and an end position.
         Args:
             begin (int): The begin of the span.
             end (int): The end of the span.
         """
-        self.begin = begin
-        self.end = end
+        object.__setattr__(self, "begin", begin)
+        object.__setattr__(self, "end", end)
+        object.__setattr__(self, "_key", (begin, end))
+        object.__setattr__(self, "_hash", hash(self._key))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Span is immutable")
+
+    def __reduce__(self):
+        return Span, self._key
 
     def __str__(self):
         return "(" + str(self.begin) + ", " + str(self.end) + ")"
@@ -53,14 +42,26 @@ class Span(ComparableMixin):
         Returns:
             True if this span is less than other, False otherwise.
         """
-        if self.begin < other.begin:
-            return True
-        elif self.begin > other.begin:
-            return False
-        elif self.end < other.end:
-            return True
-        else:
-            return False
+        return self._key < other._key
+
+    def __le__(self, other):
+        return self._key <= other._key
+
+    def __gt__(self, other):
+        return self._key > other._key
+
+    def __ge__(self, other):
+        return self._key >= other._key
+
+    def __eq__(self, other):
+        if isinstance(other, Span):
+            return self._key == other._key
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, Span):
+            return self._key != other._key
+        return NotImplemented
 
     def embeds(self, other):
         """ Check whether this span embeds another span.
@@ -72,7 +73,7 @@ class Span(ComparableMixin):
         return self.begin <= other.begin and self.end >= other.end
 
     def __hash__(self):
-        return hash((self.begin, self.end))
+        return self._hash
 
     @staticmethod
     def parse(span_string):
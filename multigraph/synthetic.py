@@ -0,0 +1,284 @@
+""" Generate synthetic DGS-like documents, for benchmarking."""
+
+import string
+
+import numpy as np
+
+from multigraph import features as multigraph_features
+
+# where the glosses of the corpus are signed, in video pixels
+SIGNING_SPACE_CENTER = np.array([270.0, 160.0])
+SIGNING_SPACE_STD = 60.0
+# I signs point at the chest, YOU signs at the addressee
+I_LOCATION = np.array([270.0, 205.0])
+YOU_LOCATION = np.array([270.0, 125.0])
+POINTING_STD = 12.0
+# distance between the finger MCP and the finger tip
+FINGER_STD = 6.0
+# fraction of glosses the hand tracker lost (coordinates [0, 0])
+TRACKING_FAILURES = 0.01
+
+# fractions of the pronouns which are I, YOU and INDEX signs
+PRONOUN_CLASSES = (multigraph_features.I_CLASS,
+                   multigraph_features.YOU_CLASS,
+                   multigraph_features.INDEX_CLASS)
+PRONOUN_MIX = (0.45, 0.05, 0.5)
+
+# probability that an INDEX sign points at a locus used before
+LOCUS_REUSE = 0.6
+# number of recent loci of a signer an INDEX sign may point at again
+RECENT_LOCI = 3
+
+
+def generate_lexicon(rng, size=2000):
+    """ Generate the non-pronoun glosses of a vocabulary, shaped like the
+    glosses of the corpus (verbs with a TO- prefix, gestures, numbers,
+    variants and $/^/* decorations).
+    Args:
+        rng (np.random.Generator): The source of randomness.
+        size (int): The number of glosses.
+    Returns:
+        list(str): The glosses, most frequent first.
+    """
+    syllables = [c + v for c in "BDFGHKLMNPRSTVW" for v in "AEIOU"]
+    lexicon = []
+    for _ in range(size):
+        stem = "".join(rng.choice(syllables, size=rng.integers(2, 4)))
+        kind = rng.random()
+        if kind < 0.3:
+            gloss = "TO-" + stem + str(rng.integers(1, 4))
+        elif kind < 0.35:
+            gloss = "$GEST-" + stem + "^"
+        elif kind < 0.38:
+            gloss = "$NUM-" + stem + "1:" + str(rng.integers(1, 10))
+        else:
+            gloss = stem + str(rng.integers(1, 6))
+        if rng.random() < 0.3:
+            gloss += rng.choice(list("ABC"))
+        if rng.random() < 0.2:
+            gloss += "*"
+        lexicon.append(gloss)
+    return lexicon
+
+
+class _DocumentGenerator:
+    """ The state of the generation of one document: the current signer,
+    the loci set up by every signer and the entities mentioned so far. """
+    def __init__(self, rng, num_signers, pronoun_density, lexicon,
+                 mean_sentence_length, mean_turn_length):
+        self.rng = rng
+        self.signers = list(string.ascii_uppercase[:num_signers])
+        self.pronoun_density = pronoun_density
+        self.lexicon = lexicon
+        self.mean_sentence_length = mean_sentence_length
+        self.mean_turn_length = mean_turn_length
+
+        # Zipf distribution over the lexicon
+        ranks = np.arange(1, len(lexicon) + 1)
+        self.cumulative = np.cumsum(1.0 / ranks)
+        self.cumulative /= self.cumulative[-1]
+
+        self.signer = self.signers[0]
+        self.turn_left = rng.geometric(1.0 / mean_turn_length)
+        self.loci = {signer: [] for signer in self.signers}
+        # entity ids are the position of the first mention, as in the corpus
+        self.entities = {}
+        self.time = int(rng.integers(0, 500))
+
+    def generate(self, num_glosses):
+        glosses = []
+        participant = []
+        sentence = []
+
+        for position in range(num_glosses):
+            if not sentence:
+                sentence_length = 1 + self.rng.poisson(
+                    self.mean_sentence_length - 1)
+                glosses.append(sentence)
+
+            self.__next_signer()
+            participant.append(self.signer)
+            sentence.append(self.__gloss(position, len(sentence),
+                                         glosses, participant))
+
+            if len(sentence) == sentence_length:
+                sentence = []
+
+        text = " . ".join(" ".join(gloss["Lexeme_Sign"] for gloss in sent)
+                          for sent in glosses) + " ."
+
+        return {"text": text, "glosses": glosses, "participant": participant}
+
+    def __next_signer(self):
+        if self.turn_left == 0:
+            others = [signer for signer in self.signers
+                      if signer != self.signer]
+            if others:
+                self.signer = others[self.rng.integers(len(others))]
+            self.turn_left = self.rng.geometric(1.0 / self.mean_turn_length)
+        self.turn_left -= 1
+
+    def __addressee(self):
+        others = [signer for signer in self.signers if signer != self.signer]
+        if others:
+            return ("signer", others[0] if len(others) == 1 else
+                    others[self.rng.integers(len(others))])
+        return ("interlocutor",)
+
+    def __entity(self, key, position):
+        if key not in self.entities:
+            self.entities[key] = position
+        return self.entities[key]
+
+    def __gloss(self, position, gloss_id, glosses, participant):
+        rng = self.rng
+        entity = None
+
+        if rng.random() < self.pronoun_density:
+            gloss_class = PRONOUN_CLASSES[
+                rng.choice(len(PRONOUN_CLASSES), p=PRONOUN_MIX)]
+        else:
+            gloss_class = multigraph_features.OTHER_CLASS
+
+        if gloss_class == multigraph_features.I_CLASS:
+            lexeme = str(rng.choice(multigraph_features.I_SIGNS))
+            target = I_LOCATION + rng.normal(0, POINTING_STD, 2)
+            entity = self.__entity(("signer", self.signer), position)
+        elif gloss_class == multigraph_features.YOU_CLASS:
+            lexeme = str(rng.choice(multigraph_features.YOU_SIGNS))
+            target = YOU_LOCATION + rng.normal(0, POINTING_STD, 2)
+            entity = self.__entity(self.__addressee(), position)
+        elif gloss_class == multigraph_features.INDEX_CLASS:
+            lexeme = "$" + str(
+                rng.choice(multigraph_features.INDEX_SIGNS[:3]))
+            loci = self.loci[self.signer]
+            if loci and rng.random() < LOCUS_REUSE:
+                key, locus = loci[-1 - rng.integers(min(len(loci),
+                                                        RECENT_LOCI))]
+            else:
+                key = ("locus", self.signer, len(loci))
+                locus = SIGNING_SPACE_CENTER + \
+                    rng.normal(0, SIGNING_SPACE_STD, 2)
+                loci.append((key, locus))
+                self.__introduce(key, position, glosses, participant)
+            target = locus + rng.normal(0, POINTING_STD, 2)
+            entity = self.__entity(key, position)
+        else:
+            lexeme = self.lexicon[min(
+                np.searchsorted(self.cumulative, rng.random()),
+                len(self.lexicon) - 1)]
+            target = SIGNING_SPACE_CENTER + rng.normal(0, SIGNING_SPACE_STD, 2)
+
+        # the lexicon is decorated already
+        if gloss_class != multigraph_features.OTHER_CLASS and \
+                rng.random() < 0.2:
+            lexeme += "*"
+
+        tip = target
+        mcp = tip + rng.normal(0, FINGER_STD, 2)
+        if gloss_class == multigraph_features.OTHER_CLASS and \
+                rng.random() < TRACKING_FAILURES:
+            tip = mcp = np.zeros(2)
+
+        start = self.time + int(rng.integers(0, 250))
+        end = start + int(rng.integers(120, 600))
+        self.time = end
+
+        gloss = {
+            "start": start,
+            "end": end,
+            "gloss": lexeme,
+            "hand": "r" if rng.random() < 0.8 else "l",
+            "Lexeme_Sign": lexeme,
+            "Gebärde": lexeme,
+            "Sign": lexeme,
+            "FINGER_MCP": mcp.tolist(),
+            "FINGER_TIP": tip.tolist(),
+            "gloss_id": gloss_id,
+        }
+        if entity is not None:
+            gloss["entity"] = entity
+            gloss["entity_labels"] = []
+        return gloss
+
+    def __introduce(self, key, position, glosses, participant):
+        # half of the new loci are set up for the noun signed just before
+        if position == 0 or participant[position - 1] != self.signer or \
+                self.rng.random() < 0.5:
+            return
+
+        previous = glosses[-1][-1] if glosses[-1] else glosses[-2][-1]
+        if "entity" in previous or not multigraph_features.is_noun_like(
+                previous["Lexeme_Sign"]):
+            return
+
+        previous["entity"] = self.__entity(key, position - 1)
+        previous["entity_labels"] = []
+
+
+def generate_document(num_glosses=500, num_signers=2, pronoun_density=0.15,
+                      seed=0, mean_sentence_length=5, mean_turn_length=40,
+                      lexicon=None):
+    """ Generate a document in the format of the corpus files.
+
+    Glosses are drawn from a Zipf distribution over a synthetic lexicon,
+    except for a fraction of I, YOU and INDEX signs. I and YOU signs point
+    at the signer and the addressee, INDEX signs point at loci the signer
+    sets up in the signing space and often points at again, and the
+    pronouns (and some nouns introducing a locus) are annotated with their
+    entity. Signers take turns of geometrically distributed length.
+
+    Args:
+        num_glosses (int): The number of glosses.
+        num_signers (int): The number of signers (at most 26).
+        pronoun_density (float): The fraction of glosses which are I, YOU
+            or INDEX signs.
+        seed (int): The seed of the generator, equal seeds give equal
+            documents.
+        mean_sentence_length (float): The mean number of glosses per
+            sentence.
+        mean_turn_length (float): The mean number of glosses signed before
+            the signer changes.
+        lexicon (list(str)): The non-pronoun glosses, most frequent first.
+            Defaults to a lexicon generated from the seed.
+
+    Returns:
+        dict: The document, with the keys "text", "glosses" (a list of
+        sentences, which are lists of glosses) and "participant" (the
+        signer of every gloss).
+    """
+    if not 1 <= num_signers <= len(string.ascii_uppercase):
+        raise ValueError("Unsupported number of signers: " +
+                         str(num_signers))
+
+    rng = np.random.default_rng(seed)
+    if lexicon is None:
+        lexicon = generate_lexicon(rng)
+
+    generator = _DocumentGenerator(rng, num_signers, pronoun_density,
+                                   lexicon, mean_sentence_length,
+                                   mean_turn_length)
+    return generator.generate(num_glosses)
+
+
+def generate_corpus(num_documents=10, num_glosses=500, num_signers=2,
+                    pronoun_density=0.15, seed=0, **kwargs):
+    """ Generate the documents of a corpus file, see generate_document.
+    The documents share a lexicon.
+    Args:
+        num_documents (int): The number of documents.
+        num_glosses (int): The number of glosses of every document.
+        num_signers (int): The number of signers of every document.
+        pronoun_density (float): The fraction of glosses which are I, YOU
+            or INDEX signs.
+        seed (int): The seed of the generator.
+        **kwargs: Further arguments of generate_document.
+    Returns:
+        dict(str, dict): The documents by video id, in the format of the
+        corpus files.
+    """
+    lexicon = generate_lexicon(np.random.default_rng(seed))
+    return {"synthetic%05d" % k: generate_document(
+                num_glosses, num_signers, pronoun_density,
+                seed=[seed, k], lexicon=lexicon, **kwargs)
+            for k in range(num_documents)}
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from multigraph import multigraphs, features, decoders, \
+    corpora, mentions, candidates, scorers, synthetic
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(message)s')
+
+STAGES = ("load", "mentions", "graph", "decode", "write", "score")
+
+
+def run_pipeline(input_filename, output_filename, args, measure):
+    """ Run the stages of run-multigraph.py on a file.
+    Args:
+        input_filename (str): The corpus file.
+        output_filename (str): The file the output is written to.
+        args (argparse.Namespace): The options of the benchmark.
+        measure (function): Called with the name of every stage, returns
+            a context manager measuring it.
+    Returns:
+        (int, dict): The number of edges considered and the scores.
+    """
+    model_features, graph = features.get_model(args.model)
+    candidate_generator = candidates.CandidateGenerator(
+        support=candidates.feature_support(model_features))
+    cmc = multigraphs.CorefMultigraphCreator(
+        model_features, candidates=candidate_generator, lazy=args.lazy)
+    decoder = decoders.MultigraphDecoder(cmc, graph)
+
+    with measure("load"):
+        corpus = corpora.Corpus.from_file("benchmark", input_filename,
+                                          use_cache=False)
+
+    with measure("mentions"):
+        for doc in corpus:
+            doc.system_mentions = \
+                [mentions.Mention.dummy_from_document(doc)] + \
+                mentions.Mention.from_document_spans(doc.spans, doc)
+
+    with measure("graph"):
+        graphs = [cmc.construct_graph_from_mentions(doc.system_mentions[1:])
+                  for doc in corpus]
+
+    with measure("decode"):
+        for doc, multigraph in zip(corpus, graphs):
+            doc.antecedent_decisions = {}
+            decoder.decode_for_one_document(doc.system_mentions[1:],
+                                            multigraph)
+
+    del graphs
+
+    with measure("write"):
+        with corpora.open_output(output_filename) as out:
+            corpus.write_to_file(out)
+
+    with measure("score"):
+        scores = scorers.score_documents(corpus)
+
+    return candidate_generator.num_candidates, scores
+
+
+class Timer:
+    """ Measures the wall-clock time of every stage. """
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, stage):
+        return _Measurement(self, stage)
+
+    def start(self, stage):
+        return time.perf_counter()
+
+    def stop(self, stage, started):
+        self.seconds[stage] = time.perf_counter() - started
+
+
+class MemoryTracer:
+    """ Measures the peak of the memory allocated during every stage, on
+    top of what was allocated before it. """
+    def __init__(self):
+        self.peak_bytes = {}
+
+    def __call__(self, stage):
+        return _Measurement(self, stage)
+
+    def start(self, stage):
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def stop(self, stage, started):
+        self.peak_bytes[stage] = tracemalloc.get_traced_memory()[1] - started
+
+
+class _Measurement:
+    def __init__(self, meter, stage):
+        self.meter = meter
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = self.meter.start(self.stage)
+
+    def __exit__(self, *exc_info):
+        self.meter.stop(self.stage, self.started)
+
+
+def get_config(args):
+    return {"model": args.model,
+            "lazy": args.lazy,
+            "documents": args.documents,
+            "glosses": args.glosses,
+            "signers": args.signers,
+            "pronoun_density": args.pronoun_density,
+            "seed": args.seed}
+
+
+def get_config_key(config):
+    return ("%(model)s%(lazy)s-%(documents)dx%(glosses)d-%(signers)d"
+            "signers-%(pronoun_density)g-seed%(seed)d") % dict(
+        config, lazy="-lazy" if config["lazy"] else "")
+
+
+def run_benchmark(args, directory):
+    input_filename = os.path.join(directory, "corpus.json")
+    output_filename = os.path.join(directory, "output")
+
+    logging.info("Generating %d documents of %d glosses", args.documents,
+                 args.glosses)
+    with open(input_filename, "w") as file:
+        json.dump(synthetic.generate_corpus(
+            args.documents, args.glosses, args.signers, args.pronoun_density,
+            args.seed), file)
+
+    seconds = {stage: float("inf") for stage in STAGES}
+    for repetition in range(args.repeat):
+        logging.info("Timing run %d of %d", repetition + 1, args.repeat)
+        timer = Timer()
+        num_edges, scores = run_pipeline(input_filename, output_filename,
+                                         args, timer)
+        for stage in STAGES:
+            seconds[stage] = min(seconds[stage], timer.seconds[stage])
+
+    with open(output_filename, "rb") as file:
+        output_md5 = hashlib.md5(file.read()).hexdigest()
+
+    logging.info("Tracing memory")
+    tracer = MemoryTracer()
+    tracemalloc.start()
+    try:
+        run_pipeline(input_filename, output_filename, args, tracer)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "config": get_config(args),
+        "stages": {stage: {"seconds": seconds[stage],
+                           "peak_bytes": tracer.peak_bytes[stage]}
+                   for stage in STAGES},
+        "edges": num_edges,
+        "output_md5": output_md5,
+        "scores": {metric: list(score) for metric, score in scores.items()},
+    }
+
+
+def get_portable_result(result):
+    """ Drop the measurements of a result which depend on the machine.
+    Args:
+        result (dict): The result, as returned by run_benchmark.
+    Returns:
+        dict: The configuration, edges, output md5 and scores of the result.
+    """
+    return {key: value for key, value in result.items() if key != "stages"}
+
+
+def format_report(result, reference=None):
+    lines = ["%-10s %12s %14s" % ("stage", "seconds", "peak MiB")]
+    for stage in STAGES:
+        measured = result["stages"][stage]
+        line = "%-10s %12.4f %14.2f" % (stage, measured["seconds"],
+                                        measured["peak_bytes"] / 2 ** 20)
+        if reference is not None and "stages" in reference:
+            expected = reference["stages"][stage]
+            line += "   (baseline %.4f s, %.2f MiB)" % (
+                expected["seconds"], expected["peak_bytes"] / 2 ** 20)
+        lines.append(line)
+    lines.append("edges: %d, output md5: %s" % (result["edges"],
+                                               result["output_md5"]))
+    return "\n".join(lines)
+
+
+def find_regressions(result, reference, tolerance, min_seconds):
+    """ Compare a result to a baseline result of the same configuration.
+    Time and memory are only compared if the baseline has them, that is if
+    it was stored with --save-timings.
+    Args:
+        result (dict): The result, as returned by run_benchmark.
+        reference (dict): The baseline result.
+        tolerance (float): The allowed relative increase of time and memory.
+        min_seconds (float): Time increases below this many seconds are
+            never reported, they are measurement noise.
+    Returns:
+        list(str): A description of every regression.
+    """
+    regressions = []
+
+    for stage in STAGES if "stages" in reference else ():
+        measured = result["stages"][stage]
+        expected = reference["stages"][stage]
+        if measured["seconds"] > expected["seconds"] * (1 + tolerance) and \
+                measured["seconds"] - expected["seconds"] > min_seconds:
+            regressions.append("%s took %.4f s, baseline %.4f s" % (
+                stage, measured["seconds"], expected["seconds"]))
+        if measured["peak_bytes"] > expected["peak_bytes"] * (1 + tolerance):
+            regressions.append("%s allocated %d bytes, baseline %d" % (
+                stage, measured["peak_bytes"], expected["peak_bytes"]))
+
+    if result["edges"] != reference["edges"]:
+        regressions.append("%d edges were considered, baseline %d" % (
+            result["edges"], reference["edges"]))
+    if result["output_md5"] != reference["output_md5"]:
+        regressions.append("the output changed")
+    for metric, expected in sorted(reference["scores"].items()):
+        measured = result["scores"].get(metric)
+        if measured is None or not all(
+                math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+                for a, b in zip(measured, expected)):
+            regressions.append("the %s scores are %s, baseline %s" % (
+                metric, measured and [float(score) for score in measured],
+                expected))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the stages of '
+                                                 'the multigraph coreference '
+                                                 'resolution system on a '
+                                                 'synthetic corpus.')
+    parser.add_argument("--model",
+                        default="multigraph",
+                        type=str)
+    parser.add_argument("--lazy",
+                        default=False,
+                        action="store_true",
+                        help='Compute edge weights while decoding.')
+    parser.add_argument("--documents",
+                        default=10,
+                        type=int,
+                        help='The number of documents.')
+    parser.add_argument("--glosses",
+                        default=2000,
+                        type=int,
+                        help='The number of glosses per document.')
+    parser.add_argument("--signers",
+                        default=2,
+                        type=int,
+                        help='The number of signers per document.')
+    parser.add_argument("--pronoun-density",
+                        default=0.15,
+                        type=float,
+                        help='The fraction of I, YOU and INDEX signs.')
+    parser.add_argument("--seed",
+                        default=0,
+                        type=int)
+    parser.add_argument("--repeat",
+                        default=3,
+                        type=int,
+                        help='Report the fastest of this many runs of every '
+                             'stage.')
+    parser.add_argument("--baseline",
+                        default=os.path.join("benchmarks", "baseline.json"),
+                        help='The file of the baseline results.')
+    parser.add_argument("--save-baseline",
+                        default=False,
+                        action="store_true",
+                        help='Store the results as the baseline of this '
+                             'configuration instead of comparing to it.')
+    parser.add_argument("--save-timings",
+                        default=False,
+                        action="store_true",
+                        help='With --save-baseline, also store the time and '
+                             'memory of every stage. They depend on the '
+                             'machine, so only store them in a local '
+                             'baseline file.')
+    parser.add_argument("--tolerance",
+                        default=0.25,
+                        type=float,
+                        help='The allowed relative increase of time and '
+                             'memory per stage.')
+    parser.add_argument("--min-seconds",
+                        default=0.02,
+                        type=float,
+                        help='Ignore time increases smaller than this.')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = run_benchmark(args, directory)
+
+    key = get_config_key(result["config"])
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+
+    if args.save_baseline:
+        baselines[key] = result if args.save_timings else \
+            get_portable_result(result)
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        logging.info("Stored the baseline of %s:\n%s", key,
+                     format_report(result))
+    elif key not in baselines:
+        logging.info("No baseline for %s:\n%s", key, format_report(result))
+    else:
+        reference = baselines[key]
+        logging.info("Results of %s:\n%s", key,
+                     format_report(result, reference))
+        regressions = find_regressions(result, reference, args.tolerance,
+                                       args.min_seconds)
+        for regression in regressions:
+            logging.error("Regression: %s", regression)
+        if regressions:
+            sys.exit(1)
+
+    logging.info("Finished")
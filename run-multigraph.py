@@ -1,62 +1,233 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
+import cProfile
 import logging
 import json
 
 from multigraph import multigraphs, features, decoders, \
-    corpora, mentions
+    corpora, mentions, candidates, scorers, profiles
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
 
-parser = argparse.ArgumentParser(description='Run the multigraph coreference '
-                                             'resolution system..')
-parser.add_argument('-in',
-                    required=True,
-                    dest='input_filename',
-                    help='The input file.')
-parser.add_argument('-out',
-                    dest='output_filename',
-                    required=True,
-                    help='The output file.')
-parser.add_argument("--model",
-                    default="multigraph",
-                    type=str)
-
-args = parser.parse_args()
-
-logging.info("Reading in corpus")
-
-corpus = corpora.Corpus.from_file("my corpus",
-                                  args.input_filename)
-
-logging.info("Extracting system mentions")
-for doc in corpus:
-    doc.system_mentions = [mentions.Mention.dummy_from_document(doc)] + [mentions.Mention.from_document(span, doc)
-                       for span in doc.spans]
-
-if args.model == "multigraph":
-    # features = [features.not_me_or_you, features.me_or_you, features.spatially_close, features.prev_ante_is_noun, \
-    #             features.third_person, features.spatially_far]
-    features = [features.not_me_or_you, features.me_or_you, features.spatially_close, features.prev_ante_is_noun]
-    graph = True
-elif args.model == "baseline":
-    features = [features.base_me_or_you, features.temporally_close, features.prev_ante_is_noun]
-    graph = False
-else:
-    raise ValueError
-
-cmc = multigraphs.CorefMultigraphCreator(features)
-
-logging.info("Decoding")
-
-decoder = decoders.MultigraphDecoder(cmc, graph)
-
-decoder.decode(corpus)
-
-logging.info("Writing coreference to file")
-
-corpus.write_to_file(open(args.output_filename, 'w'))
-
-logging.info("Finished")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the multigraph coreference '
+                                                 'resolution system..')
+    parser.add_argument('-in',
+                        required=True,
+                        dest='input_filename',
+                        help='The input file.')
+    parser.add_argument('-out',
+                        dest='output_filename',
+                        required=True,
+                        help='The output file (compressed if it ends in '
+                             '.gz, .bz2 or .xz).')
+    parser.add_argument("--model",
+                        default="multigraph",
+                        type=str)
+    parser.add_argument("--token-window",
+                        type=int,
+                        help='Only consider antecedents ending fewer than this '
+                             'many tokens before the anaphor.')
+    parser.add_argument("--time-window",
+                        type=int,
+                        help='Only consider antecedents ending less than this '
+                             'many milliseconds before the anaphor starts.')
+    parser.add_argument("--buckets",
+                        default=False,
+                        action="store_true",
+                        help='Only link I/YOU signs to I/YOU signs and INDEX '
+                             'signs to INDEX signs (besides the immediately '
+                             'preceding gloss).')
+    parser.add_argument("--lazy",
+                        default=False,
+                        action="store_true",
+                        help='Compute edge weights while decoding instead of '
+                             'storing the graph, memory is then linear in the '
+                             'document length.')
+    parser.add_argument("--workers",
+                        default=1,
+                        type=int,
+                        help='Decode documents in a pool of this many '
+                             'processes.')
+
+    parser.add_argument("--stream",
+                        default=False,
+                        action="store_true",
+                        help='Read, decode and write one document at a time '
+                             '(in input order) instead of loading the whole '
+                             'corpus. Files ending in .jsonl are read as JSON '
+                             'Lines.')
+
+    parser.add_argument("--compile-cache",
+                        default=False,
+                        action="store_true",
+                        help='Write a binary cache of the parsed input next '
+                             'to it (unless it is fresh). Later runs on the '
+                             'same input load the cache instead of parsing.')
+    parser.add_argument("--no-cache",
+                        default=False,
+                        action="store_true",
+                        help='Parse the input even if a fresh cache exists.')
+    parser.add_argument("--score",
+                        default=False,
+                        action="store_true",
+                        help='Score the output against the annotated entities '
+                             'of the input (MUC, B3, CEAF, BLANC and LEA).')
+    parser.add_argument("--conll-out",
+                        metavar="PREFIX",
+                        help='Also write the CoNLL key and response read by '
+                             'scorer.pl to PREFIX.key and PREFIX.answer.')
+    parser.add_argument("--profile",
+                        metavar="REPORT",
+                        help='Write a json report of the time and allocations '
+                             'of every stage and document, and of the '
+                             'evaluations of every feature, to REPORT. '
+                             'Documents are then decoded serially.')
+    parser.add_argument("--profile-dump",
+                        metavar="FILE",
+                        help='Write cProfile statistics of the run to FILE '
+                             '(readable by pstats, snakeviz, flameprof or '
+                             'gprof2dot).')
+
+    args = parser.parse_args()
+
+    if args.profile_dump:
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    profiler = profiles.Profiler(enabled=args.profile is not None)
+    profiler.start()
+
+    if args.compile_cache:
+        logging.info("Compiling corpus cache")
+        if not corpora.Corpus.compile_cache(args.input_filename):
+            logging.info("Corpus cache is fresh")
+
+    features, graph = features.get_model(args.model)
+
+    candidate_generator = candidates.CandidateGenerator(
+        token_window=args.token_window,
+        time_window=args.time_window,
+        buckets=candidates.PRONOUN_BUCKETS if args.buckets else None,
+        support=candidates.feature_support(features))
+
+    cmc = multigraphs.CorefMultigraphCreator(features,
+                                             candidates=candidate_generator,
+                                             lazy=args.lazy)
+
+    decoder = decoders.MultigraphDecoder(cmc, graph)
+
+    if args.profile:
+        if args.workers > 1:
+            logging.warning("Decoding serially to profile documents")
+            args.workers = 1
+        profiler.instrument(decoder)
+
+    def extract_system_mentions(doc):
+        with profiler.measure(doc, "mentions"):
+            doc.system_mentions = \
+                [mentions.Mention.dummy_from_document(doc)] + \
+                mentions.Mention.from_document_spans(doc.spans, doc)
+        return doc
+
+    if args.stream:
+        logging.info("Decoding corpus document by document")
+
+        documents = (extract_system_mentions(doc) for doc in
+                     profiler.iter_documents(corpora.Corpus.iter_documents(
+                         args.input_filename, use_cache=not args.no_cache)))
+
+        def write_documents(out, key=None, answer=None):
+            for index, doc in enumerate(decoder.decode_documents(
+                    documents, workers=args.workers)):
+                with profiler.measure(doc, "write"):
+                    doc.write_simple_output(out)
+                if key is not None:
+                    with profiler.measure(doc, "conll"):
+                        key.write(doc.to_conll_key(index))
+                        answer.write(doc.to_conll_response(index))
+                yield doc
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(profiler.stage("stream"))
+            out = stack.enter_context(
+                corpora.open_output(args.output_filename))
+            if args.conll_out:
+                key = stack.enter_context(
+                    corpora.open_output(args.conll_out + ".key"))
+                answer = stack.enter_context(
+                    corpora.open_output(args.conll_out + ".answer"))
+                decoded = write_documents(out, key, answer)
+            else:
+                decoded = write_documents(out)
+
+            if args.score:
+                scores = scorers.score_documents(decoded)
+            else:
+                for _ in decoded:
+                    pass
+    else:
+        logging.info("Reading in corpus")
+
+        with profiler.stage("read"):
+            corpus = corpora.Corpus.from_file("my corpus",
+                                              args.input_filename,
+                                              use_cache=not args.no_cache)
+
+        logging.info("Extracting system mentions")
+        with profiler.stage("mentions"):
+            for doc in corpus:
+                extract_system_mentions(doc)
+
+        logging.info("Decoding")
+
+        with profiler.stage("decode"):
+            decoder.decode(corpus, workers=args.workers)
+
+        logging.info("Writing coreference to file")
+
+        with profiler.stage("write"):
+            with corpora.open_output(args.output_filename) as out:
+                for doc in corpus:
+                    with profiler.measure(doc, "write"):
+                        doc.write_simple_output(out)
+
+        if args.conll_out:
+            with profiler.stage("conll"):
+                with corpora.open_output(args.conll_out + ".key") as key:
+                    corpus.write_conll_key(key)
+                with corpora.open_output(
+                        args.conll_out + ".answer") as answer:
+                    corpus.write_conll_response(answer)
+
+        if args.score:
+            with profiler.stage("score"):
+                scores = scorers.score_documents(corpus)
+
+    logging.info("Considered %d edges, pruned %d edges",
+                 candidate_generator.num_candidates,
+                 candidate_generator.num_pruned)
+
+    if args.score:
+        logging.info("Scores:\n%s", scorers.format_scores(scores))
+
+    profiler.stop()
+
+    if args.profile:
+        report = profiler.to_json()
+        report["arguments"] = vars(args)
+        with open(args.profile, "w") as file:
+            json.dump(report, file, indent=2)
+        for document in report["documents"][:3]:
+            logging.info("Profiled %s: %.3f s, %d mentions, %d edges",
+                         document["document"], document["seconds"],
+                         document["mentions"] or 0, document["edges"])
+
+    if args.profile_dump:
+        cprofile.disable()
+        cprofile.dump_stats(args.profile_dump)
+
+    logging.info("Finished")
@@ -0,0 +1,23 @@
+import io
+import json
+import unittest
+
+from multigraph import corpora
+
+
+class IterObjectItemsTest(unittest.TestCase):
+    DOCUMENT = ('{"a": 1.5, "b": -2e-3, "c": 10, "d": "x, y}", '
+                '"e": {"f": [1, 2.25, {"g": null}], "h": true},\n'
+                ' "i" : 3E+2 , "j": [], "k": 0.125}')
+
+    def test_every_chunk_size(self):
+        expected = list(json.loads(self.DOCUMENT).items())
+        for chunk_size in range(1, 17):
+            with self.subTest(chunk_size=chunk_size):
+                items = corpora._iter_object_items(
+                    io.StringIO(self.DOCUMENT), chunk_size)
+                self.assertEqual(list(items), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
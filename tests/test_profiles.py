@@ -0,0 +1,31 @@
+import unittest
+
+from multigraph import candidates, decoders, features, mentions, \
+    multigraphs, profiles
+from multigraph.documents import Document
+
+
+class InstrumentTest(unittest.TestCase):
+    def test_empty_document(self):
+        document = Document("empty", {"text": "", "glosses": [],
+                                      "participant": []})
+        document.system_mentions = [
+            mentions.Mention.dummy_from_document(document)] + \
+            mentions.Mention.from_document_spans(document.spans, document)
+
+        model_features, graph = features.get_model("multigraph")
+        cmc = multigraphs.CorefMultigraphCreator(
+            model_features, candidates=candidates.CandidateGenerator(
+                support=candidates.feature_support(model_features)))
+        decoder = decoders.MultigraphDecoder(cmc, graph)
+
+        profiler = profiles.Profiler(trace_memory=False)
+        profiler.instrument(decoder)
+        decoder.decode([document])
+
+        self.assertEqual(document.antecedent_decisions, {})
+        self.assertEqual(profiler.to_json()["edges"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()